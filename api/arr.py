@@ -12,13 +12,16 @@
 
 import sys
 import mmap
-import struct
 import re
 
-START_ARR_TAG = "\x71\x53\x76\x45\x01\x00\x05"
-END_ARR_TAG = "\xf1\x00\x00\x00\xff\xff\xff\x3f"
+import chunkIndex
+import chunkSchema
 
-START_TXT_TAG = "\x71\x53\x78\x54\x01\x00\x20\x00\x00\x00"
+START_ARR_TAG = chunkSchema.ARR_SECTIONS.tag
+END_ARR_TAG = b"\xf1\x00\x00\x00\xff\xff\xff\x3f"
+
+START_TXT_TAG = chunkSchema.ARR_TEXT.tag
+ARR_SECTION = chunkSchema.ARR_SECTION
 
 def stripRTF(txt):
   """
@@ -29,56 +32,40 @@ def stripRTF(txt):
   txt = re.sub(r"\\\S*\s", "", txt)
   return txt
 
-# Converts a text chunk given as a byte string
+# Converts a text chunk given as a byte string or chunk view
 # returns a tuple with key, text
 def decodeTextChunk( textChunk ):
-  key, = struct.unpack("<I", textChunk[10:14])
-  size, = struct.unpack("<I", textChunk[28:32])
-  kind, = struct.unpack("B", textChunk[60])
-  text = textChunk[0x48:size+36].strip("\x00}r")
+  key, size, kind = chunkSchema.ARR_TEXT_HEADER.unpack(textChunk)
+  text = chunkIndex.toText(chunkIndex.viewBytes(textChunk, 0x48, size+36).strip(b"\x00}r"))
   # Translate rtf if needed
   if kind == 0x13:
     text = stripRTF(text)
   return {key : text}
   
 
-# Converts an arrangement chunk given as a byte string
+# Converts an arrangement chunk given as a byte string or chunk view
 # returns an array of tuples with textKey, length
 def decodeArrEvents( arrChunk ):
-  # Compute start of arrangement data
-  dataStart = 0x24
-  
   # Get size of data chunk
-  size, = struct.unpack("<Q", arrChunk[0x1C:0x24])
-
-  # Break into event chunks
-  chunks = [arrChunk[i:i+48] for i in range(dataStart, dataStart+size-48, 48)]
-
-  # Parse events
-  events = []
-  for e in chunks:
-    key, = struct.unpack("<I", e[0x10:0x14])
-    length, = struct.unpack("<I", e[0x1C:0x20])
-    events.append((key, length))
+  size = chunkSchema.CHUNK_HEADER.field(arrChunk, "size")
 
-  return events
+  # Parse 48 byte events in one sweep, the last record ends the list
+  count = len(range(0, size - ARR_SECTION.size, ARR_SECTION.size))
+  return ARR_SECTION.unpackAll(arrChunk, chunkSchema.ARR_SECTIONS.dataOffset, count)
 
 # Method to pull out arrangment facts from ProjectData file in a mmap
 def getArr(pd):
+  pd = chunkIndex.getIndex(pd)
   # Find the start of the arragement track record
-  recAddr = pd.find(START_ARR_TAG)
+  recAddr = pd.findChunk(START_ARR_TAG)
   if recAddr == -1:
     return "Arrangement data not found"
   # Decode arrangement events into an array
-  events = decodeArrEvents(pd[recAddr:])
+  events = decodeArrEvents(pd.chunkView(recAddr))
   # Go through and decode text records
-  txtAddr = recAddr
   texts = {}
-  while True:
-    txtAddr = pd.find(START_TXT_TAG, txtAddr + len(START_TXT_TAG))
-    if txtAddr == -1:
-      break
-    texts.update(decodeTextChunk(pd[txtAddr:]))
+  for txtAddr in pd.findChunks(START_TXT_TAG, recAddr + 1):
+    texts.update(decodeTextChunk(pd.chunkView(txtAddr)))
   # Build result by cross-referencing texts
   result = []
   for e in events:
@@ -91,11 +78,11 @@ def main():
   # Load ProjectData file into an mmap
   projectDataPath = sys.argv[1] + "/Alternatives/000/ProjectData"
   f = open(projectDataPath, "r+b")
-  mm = mmap.mmap(f.fileno(), 0)
+  mm = chunkIndex.ChunkIndex(mmap.mmap(f.fileno(), 0))
   arr = getArr(mm)
   for a in arr:
     if len(a) == 2:
-      print "Text: %s, Length: %d" % a
+      print("Text: %s, Length: %d" % a)
 
 if __name__ == "__main__":
   main()
@@ -15,6 +15,21 @@ and MetaData.plist files into a python dict by calling
 
 bandFile.load( file-path )
 
+or into a lazy BandProject by calling
+
+bandFile.load( file-path, lazy = True )
+
+A BandProject is indexed with the same keys as the dict but only decodes
+each value the first time it is read, so e.x. reading "transposition"
+never decodes note data. Close it (or use it in a with statement) when done
+so the values it decoded are written to the cache:
+
+with bandFile.load( file-path, lazy = True ) as project:
+  project["transposition"]
+
+Decoded values are kept in an on-disk cache keyed by the project's contents
+(see projectCache.py), so loading the same project again skips parsing.
+
 
 Keys of the resulting dict include:
 
@@ -47,58 +62,56 @@ Dependencies:
 ****************************************
 
 ccl_bplist.py, CCL Forensics
+chunkIndex.py
+chunkSchema.py
+channelStrips.py
+projectCache.py
 arr.py
 drummer.py
+keyedArchive.py
 midiDump.py
 trackInfo.py
-midiDump.py
 trans.py
 
 """
 
 import mmap
 import os
-import struct
 import io
 import pprint
 import sys
 
 import ccl_bplist
+import chunkIndex
+import channelStrips
+import projectCache
 import arr
 import drummer
 import midiDump
 import trackInfo
 import trans
 
-def load(filepath):
+def load(filepath, lazy = False):
   try:
-    projectData= getProjectData(filepath)
+    projectData = getProjectData(filepath)
   except OSError as error:
     print("Failed to load ProjectData for project at {}".format(filepath))
     return
-  try:
-    metaData = getMetaData(filepath)
-  except OSError as error:
-    print("Failed to load MetaData.plist for project at {}".format(filepath))
-    return
-  try:
-    displayState = getDisplayState(filepath)
-  except OSError as error:
-    print("Failed to load MetaData.plist for project at {}".format(filepath))
-    return
-  result = {}
-  result["key"] = getKey(metaData)
-  result["gender"] = getGender(metaData)
-  result["metronome"] = getMetronome(projectData)
-  result["arrangement"] = getArrangement(projectData)
-  result["drummer"] = getDrummer(projectData)
-  result["audio_loops"] = getAudioLoops(projectData)
-  result["tracks"] = getTracks(projectData)
-  result["arrangement_visible"] = getArrShown(displayState)
-  result["inst_1_info"] = getInstInfo(projectData)
-  result["transposition"] = getTrans(projectData)
-  result["default_master_track"] = defaultMasterTrack(projectData)
-  return result
+  project = BandProject(filepath, projectData)
+  if lazy:
+    return project
+  if not project.isDecoded():
+    try:
+      project.source("metaData")
+    except OSError as error:
+      print("Failed to load MetaData.plist for project at {}".format(filepath))
+      return
+    try:
+      project.source("displayState")
+    except OSError as error:
+      print("Failed to load DisplayState.plist for project at {}".format(filepath))
+      return
+  return project.toDict()
 
 #  
 # File handling functions
@@ -114,17 +127,23 @@ def getProjectData(fp):
     return mm
 
 def getMetaData(fp):
-  """Returns MetaData.plist as a python object via ccl_bplist"""
+  """
+    Returns MetaData.plist as a lazy plist view via ccl_bplist:
+    values are only decoded when read
+  """
   mdPath = os.path.join(fp, PATH_TO_PROJECT, "MetaData.plist")
-  with open(mdPath) as f:
-    pl = ccl_bplist.load(f)
+  with open(mdPath, "rb") as f:
+    pl = ccl_bplist.load_lazy(f)
     return pl
 
 def getDisplayState(fp):
-  """Returns DisplayState.plist as a pythong object via ccl_bplist"""
+  """
+    Returns DisplayState.plist as a lazy plist view via ccl_bplist:
+    values are only decoded when read
+  """
   dsPath = os.path.join(fp, PATH_TO_PROJECT, "DisplayState.plist")
-  with open(dsPath) as f:
-    pl = ccl_bplist.load(f)
+  with open(dsPath, "rb") as f:
+    pl = ccl_bplist.load_lazy(f)
     return pl
 
 #
@@ -148,7 +167,7 @@ def getGender(md):
 METRO_FLAG_OFFSET = 0x11C
 def getMetronome(pd):
   """Reads the metronome status bit and returns a boolean value"""
-  flag, = struct.unpack("B",pd[METRO_FLAG_OFFSET])
+  flag = chunkIndex.byteAt(pd, METRO_FLAG_OFFSET)
   return True if flag & 1 else False
 
 
@@ -171,7 +190,10 @@ def getDrummer(pd):
 LFUATag = b"\x4c\x46\x55\x41\x01\x11"
 PMOCTag = b"\x50\x4d\x4f\x43"
 def getAudioLoops(pd):
-  """Returns a list with file names of audio loops"""
+  """
+    Returns a list with file names of audio loops
+    Loop records are not bound to one chunk, so the whole file is scanned
+  """
   LFUAAddr = 0
   loops = []
   while True:
@@ -179,7 +201,7 @@ def getAudioLoops(pd):
     if LFUAAddr == -1:
       break
     PMOCAddr = pd.find(PMOCTag, LFUAAddr)
-    loops.append(pd[LFUAAddr + 10:PMOCAddr].strip("\x00"))
+    loops.append(chunkIndex.toText(pd[LFUAAddr + 10:PMOCAddr].strip(b"\x00")))
   return loops
 
 
@@ -207,25 +229,136 @@ def defaultMasterTrack(pd):
   """
     Returns true if the master track is still using default settings
   """
-  masterAddr = pd.find("Output 1-2")
-  startAddr = pd.find("\x55\x43\x75\x41\x01\x00\x0e", masterAddr)
-  endAddr = pd.find("\x55\x43\x75\x41\x01\x00\x0e", startAddr + 7)
-  return pd.find("Default", startAddr, endAddr) != -1
+  pd = chunkIndex.getIndex(pd)
+  master = channelStrips.getStrips(pd).get("Output 1-2")
+  if master is None or not master.slots:
+    return False
+  return pd.find(b"Default", master.slots[0], pd.chunkEnd(master.slots[0])) != -1
 
 #
 # DisplayState.plist reading functions
 #
 
 ARR_STATE_VIS_OFFSET = 0x28
-ARR_STATE_VIS_SHOWN = "\x41"
-ARR_STATE_VIS_HIDDEN = "\x23"
+ARR_STATE_VIS_SHOWN = 0x41
+ARR_STATE_VIS_HIDDEN = 0x23
+ARR_STATE_PATH = "screensetDictArray[0].layoutDictArray[0].docwWindowState.udataArrange"
 def getArrShown(ds):
   """
     Pulls out the visibility of the arrangement track
-    from the given decoded plist
+    from the given plist, only decoding the objects on ARR_STATE_PATH
+  """
+  arrData = ccl_bplist.query(ds, ARR_STATE_PATH)
+  return chunkIndex.byteAt(arrData, ARR_STATE_VIS_OFFSET) == ARR_STATE_VIS_SHOWN
+
+#
+# Lazy project object
+#
+
+# Keys of a loaded project with the file each is read from and its decoder
+PROJECT_FIELDS = [
+  ("key", "metaData", getKey),
+  ("gender", "metaData", getGender),
+  ("metronome", "projectData", getMetronome),
+  ("arrangement", "projectData", getArrangement),
+  ("drummer", "projectData", getDrummer),
+  ("audio_loops", "projectData", getAudioLoops),
+  ("tracks", "projectData", getTracks),
+  ("arrangement_visible", "displayState", getArrShown),
+  ("inst_1_info", "projectData", getInstInfo),
+  ("transposition", "projectData", getTrans),
+  ("default_master_track", "projectData", defaultMasterTrack),
+]
+
+class BandProject(object):
+  """
+    Lazily loaded GarageBand project.
+    Indexed like the dict returned by load(): each value is decoded on
+    first access and memoized. The plists are only read when one of their
+    keys is accessed, and ProjectData is only indexed when one of its keys is.
+    Values found in the project cache are never decoded again. Newly
+    decoded values are written back to it in one entry by save(),
+    which toDict() and close() call.
   """
-  arrData = ds['screensetDictArray'][0]['layoutDictArray'][0]['docwWindowState']['udataArrange']
-  return arrData[ARR_STATE_VIS_OFFSET] == ARR_STATE_VIS_SHOWN
+
+  def __init__(self, filepath, projectData):
+    self.filepath = filepath
+    self.projectData = projectData
+    self.fields = dict((k, (source, f)) for k, source, f in PROJECT_FIELDS)
+    self.values = {}
+    self.sources = {}
+    self.cacheKey = None
+    self.dirty = False
+    if projectCache.enabled():
+      self.cacheKey = projectCache.projectKey(filepath)
+      cached = projectCache.get(self.cacheKey)
+      if cached:
+        self.values.update(cached)
+
+  def source(self, name):
+    """Returns the named source file, reading it on first use"""
+    if name not in self.sources:
+      if name == "projectData":
+        self.sources[name] = chunkIndex.ChunkIndex(self.projectData)
+      elif name == "metaData":
+        self.sources[name] = getMetaData(self.filepath)
+      elif name == "displayState":
+        self.sources[name] = getDisplayState(self.filepath)
+    return self.sources[name]
+
+  def __getitem__(self, key):
+    if key not in self.values:
+      if key not in self.fields:
+        raise KeyError(key)
+      source, f = self.fields[key]
+      self.values[key] = f(self.source(source))
+      self.dirty = True
+    return self.values[key]
+
+  def isDecoded(self):
+    """Returns true if every field has already been decoded"""
+    return all(k in self.values for k in self.fields)
+
+  def save(self):
+    """
+      Writes the decoded values to the project cache
+      if any were decoded since the last save
+    """
+    if self.cacheKey is not None and self.dirty:
+      projectCache.put(self.cacheKey, self.values)
+    self.dirty = False
+
+  def close(self):
+    """Saves what was decoded, call when done with a lazily loaded project"""
+    self.save()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+  def __contains__(self, key):
+    return key in self.fields
+
+  def __iter__(self):
+    return iter(self.keys())
+
+  def __len__(self):
+    return len(PROJECT_FIELDS)
+
+  def keys(self):
+    return [k for k, _, _ in PROJECT_FIELDS]
+
+  def items(self):
+    """Decodes and returns every (key, value) pair"""
+    return [(k, self[k]) for k in self.keys()]
+
+  def toDict(self):
+    """Decodes every field and returns them as the dict load() would"""
+    result = dict(self.items())
+    self.save()
+    return result
 
 def main():
   pprint.pprint(load(sys.argv[1]))
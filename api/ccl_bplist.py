@@ -25,10 +25,9 @@ ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
-import sys
-import os
 import struct
 import datetime
+import re
 
 __version__ = "0.21"
 __description__ = "Converts Apple binary PList files into a native Python data structure"
@@ -59,227 +58,333 @@ class BplistUID:
     def __str__(self):
         return self.__repr__()
 
-def __decode_multibyte_int(b, signed=True):
-    if len(b) == 1:
-        fmt = ">B" # Always unsigned?
-    elif len(b) == 2:
-        fmt = ">h"
-    elif len(b) == 3:
-        if signed:
-            return ((b[0] << 16) | struct.unpack(">H", b[1:])[0]) - ((b[0] >> 7) * 2 * 0x800000)
-        else:
-            return (b[0] << 16) | struct.unpack(">H", b[1:])[0]
-    elif len(b) == 4:
-        fmt = ">i"
-    elif len(b) == 8:
-        fmt = ">q"
-    elif len(b) == 16:
+# Precompiled structs for the fixed size fields
+_TRAILER = struct.Struct(">6xBBQQQ")
+_SIGNED_INTS = {1: struct.Struct(">B"), # Always unsigned?
+                2: struct.Struct(">h"), 4: struct.Struct(">i"), 8: struct.Struct(">q")}
+_UNSIGNED_INTS = {1: struct.Struct(">B"), 2: struct.Struct(">H"),
+                  4: struct.Struct(">I"), 8: struct.Struct(">Q")}
+_FLOATS = {4: struct.Struct(">f"), 8: struct.Struct(">d")}
+_BIG_INT = struct.Struct(">QQ")
+_BYTE = _UNSIGNED_INTS[1]
+
+def _decode_unsigned_int(buf, offset, length):
+    """Decodes the big endian unsigned int of the given length at offset in buf"""
+    if length in _UNSIGNED_INTS:
+        return _UNSIGNED_INTS[length].unpack_from(buf, offset)[0]
+    result = 0
+    for i in range(offset, offset + length):
+        result = (result << 8) | _BYTE.unpack_from(buf, i)[0]
+    return result
+
+def _decode_signed_int(buf, offset, length):
+    """Decodes the big endian int of the given length at offset in buf"""
+    if length in _SIGNED_INTS:
+        return _SIGNED_INTS[length].unpack_from(buf, offset)[0]
+    elif length == 3:
+        result = _decode_unsigned_int(buf, offset, 3)
+        return result - ((result >> 23) * 2 * 0x800000)
+    elif length == 16:
         # special case for BigIntegers
-        high, low = struct.unpack(">QQ", b)
+        high, low = _BIG_INT.unpack_from(buf, offset)
         result = (high << 64) | low
-        if high & 0x8000000000000000 and signed:
+        if high & 0x8000000000000000:
             result -= 0x100000000000000000000000000000000
         return result
-    else:
-        raise BplistError("Cannot decode multibyte int of length {0}".format(len(b)))
-    
-    if signed and len(b) > 1:
-        return struct.unpack(fmt.lower(), b)[0]
-    else:
-        return struct.unpack(fmt.upper(), b)[0]
-
-def __decode_float(b, signed=True):
-    if len(b) == 4:
-        fmt = ">f"
-    elif len(b) == 8:
-        fmt = ">d"
-    else:
-        raise BplistError("Cannot decode float of length {0}".format(len(b)))
-
-    if signed: 
-        return struct.unpack(fmt.lower(), b)[0]
-    else:
-        return struct.unpack(fmt.upper(), b)[0]
-
-def __decode_object(f, offset, collection_offset_size, offset_table):
-    # Move to offset and read type
-    #print("Decoding object at offset {0}".format(offset))
-    f.seek(offset)
-    # A little hack to keep the script portable between py2.x and py3k
-    if sys.version_info[0] < 3:
-        type_byte = ord(f.read(1)[0])
-    else:
-        type_byte = f.read(1)[0]
-    #print("Type byte: {0}".format(hex(type_byte)))
-    if type_byte == 0x00: # Null      0000 0000
-        return None
-    elif type_byte == 0x08: # False   0000 1000
-        return False
-    elif type_byte == 0x09: # True    0000 1001
-        return True
-    elif type_byte == 0x0F: # Fill    0000 1111
-        raise BplistError("Fill type not currently supported at offset {0}".format(f.tell())) # Not sure what to return really...
-    elif type_byte & 0xF0 == 0x10: # Int    0001 xxxx
-        int_length = 2 ** (type_byte & 0x0F)
-        int_bytes = f.read(int_length)
-        return __decode_multibyte_int(int_bytes)
-    elif type_byte & 0xF0 == 0x20: # Float   0010 nnnn
-        float_length = 2 ** (type_byte & 0x0F)
-        float_bytes = f.read(float_length)
-        return __decode_float(float_bytes)
-    elif type_byte & 0xFF == 0x33: # Date   0011 0011
-        date_bytes = f.read(8)
-        date_value = __decode_float(date_bytes)
+    raise BplistError("Cannot decode multibyte int of length {0}".format(length))
+
+def _decode_float(buf, offset, length):
+    if length not in _FLOATS:
+        raise BplistError("Cannot decode float of length {0}".format(length))
+    return _FLOATS[length].unpack_from(buf, offset)[0]
+
+class _BplistReader(object):
+    """Decodes the objects of a binary plist held in a buffer, either all at
+    once (decode) or as lazy views (lazy).
+    Every object is decoded at most once: results are memoized by object
+    reference (index into the offset table), and collections are built
+    with an explicit stack so deep plists cannot hit the recursion limit."""
+
+    def __init__(self, buf):
+        self.buf = buf
         try:
-            result = datetime.datetime(2001,1,1) + datetime.timedelta(seconds = date_value)
-        except OverflowError:
-            result = datetime.datetime.min
-        return result
-    elif type_byte & 0xF0 == 0x40: # Data   0100 nnnn
-        if type_byte & 0x0F != 0x0F:
-            # length in 4 lsb
-            data_length = type_byte & 0x0F
-        else:
-            # A little hack to keep the script portable between py2.x and py3k
-            if sys.version_info[0] < 3:
-                int_type_byte = ord(f.read(1)[0])
-            else:
-                int_type_byte = f.read(1)[0]
-            if int_type_byte & 0xF0 != 0x10:
-                raise BplistError("Long Data field definition not followed by int type at offset {0}".format(f.tell()))
-            int_length = 2 ** (int_type_byte & 0x0F)
-            int_bytes = f.read(int_length)
-            data_length = __decode_multibyte_int(int_bytes, False)
-        return f.read(data_length)
-    elif type_byte & 0xF0 == 0x50: # ASCII  0101 nnnn
-        if type_byte & 0x0F != 0x0F:
-            # length in 4 lsb
-            ascii_length = type_byte & 0x0F
-        else:
-            # A little hack to keep the script portable between py2.x and py3k
-            if sys.version_info[0] < 3:
-                int_type_byte = ord(f.read(1)[0])
-            else:
-                int_type_byte = f.read(1)[0]
-            if int_type_byte & 0xF0 != 0x10:
-                raise BplistError("Long ASCII field definition not followed by int type at offset {0}".format(f.tell()))
-            int_length = 2 ** (int_type_byte & 0x0F)
-            int_bytes = f.read(int_length)
-            ascii_length = __decode_multibyte_int(int_bytes, False)
-        return f.read(ascii_length).decode("ascii")
-    elif type_byte & 0xF0 == 0x60: # UTF-16  0110 nnnn
+            self.view = memoryview(buf)
+        except TypeError:
+            # py2 mmaps and buffers have no memoryview: slice them directly
+            self.view = buf
+        if len(buf) < 40 or self._bytes(0, 8) != b"bplist00":
+            raise BplistError("Bad file header")
+        offset_int_size, self.collection_offset_size, object_count, self.top_level_object_index, offset_table_offset = \
+            _TRAILER.unpack_from(buf, len(buf) - 32)
+        self.offset_table = [_decode_unsigned_int(buf, offset_table_offset + i * offset_int_size, offset_int_size)
+                             for i in range(object_count)]
+        self.memo = {}
+        self.views = {}
+
+    def _bytes(self, start, end):
+        """Returns a copy of buf[start:end], sliced without copying the rest of buf"""
+        piece = self.view[start:end]
+        if isinstance(piece, memoryview):
+            return piece.tobytes()
+        return piece
+
+    def _read_length(self, type_byte, pos, name):
+        """Returns (length, position after the length) for the collection or
+        string whose type byte is at pos - 1"""
         if type_byte & 0x0F != 0x0F:
             # length in 4 lsb
-            utf16_length = (type_byte & 0x0F) * 2 # Length is characters - 16bit width
-        else:
-            # A little hack to keep the script portable between py2.x and py3k
-            if sys.version_info[0] < 3:
-                int_type_byte = ord(f.read(1)[0])
+            return type_byte & 0x0F, pos
+        int_type_byte = _BYTE.unpack_from(self.buf, pos)[0]
+        if int_type_byte & 0xF0 != 0x10:
+            raise BplistError("Long {0} field definition not followed by int type at offset {1}".format(name, pos + 1))
+        int_length = 2 ** (int_type_byte & 0x0F)
+        return _decode_unsigned_int(self.buf, pos + 1, int_length), pos + 1 + int_length
+
+    def _read_refs(self, pos, count):
+        size = self.collection_offset_size
+        return [_decode_unsigned_int(self.buf, pos + i * size, size) for i in range(count)]
+
+    def _read(self, ref):
+        """Decodes the object with the given reference.
+        Returns (True, value) for scalars or (False, (kind, child refs)) for collections."""
+        offset = self.offset_table[ref]
+        buf = self.buf
+        type_byte = _BYTE.unpack_from(buf, offset)[0]
+        pos = offset + 1
+        high = type_byte & 0xF0
+        if type_byte == 0x00: # Null      0000 0000
+            return True, None
+        elif type_byte == 0x08: # False   0000 1000
+            return True, False
+        elif type_byte == 0x09: # True    0000 1001
+            return True, True
+        elif type_byte == 0x0F: # Fill    0000 1111
+            raise BplistError("Fill type not currently supported at offset {0}".format(pos)) # Not sure what to return really...
+        elif high == 0x10: # Int    0001 xxxx
+            return True, _decode_signed_int(buf, pos, 2 ** (type_byte & 0x0F))
+        elif high == 0x20: # Float   0010 nnnn
+            return True, _decode_float(buf, pos, 2 ** (type_byte & 0x0F))
+        elif type_byte == 0x33: # Date   0011 0011
+            date_value = _decode_float(buf, pos, 8)
+            try:
+                result = datetime.datetime(2001,1,1) + datetime.timedelta(seconds = date_value)
+            except OverflowError:
+                result = datetime.datetime.min
+            return True, result
+        elif high == 0x40: # Data   0100 nnnn
+            length, pos = self._read_length(type_byte, pos, "Data")
+            return True, self._bytes(pos, pos + length)
+        elif high == 0x50: # ASCII  0101 nnnn
+            length, pos = self._read_length(type_byte, pos, "ASCII")
+            return True, self._bytes(pos, pos + length).decode("ascii")
+        elif high == 0x60: # UTF-16  0110 nnnn
+            length, pos = self._read_length(type_byte, pos, "UTF-16")
+            # Length is characters - 16bit width
+            return True, self._bytes(pos, pos + length * 2).decode("utf_16_be")
+        elif high == 0x80: # UID    1000 nnnn
+            return True, BplistUID(_decode_unsigned_int(buf, pos, (type_byte & 0x0F) + 1))
+        elif high == 0xA0: # Array  1010 nnnn
+            count, pos = self._read_length(type_byte, pos, "Array")
+            return False, ("list", self._read_refs(pos, count))
+        elif high == 0xC0: # Set  1100 nnnn
+            count, pos = self._read_length(type_byte, pos, "Set")
+            return False, ("list", self._read_refs(pos, count))
+        elif high == 0xD0: # Dict  1101 nnnn
+            count, pos = self._read_length(type_byte, pos, "Dict")
+            # Key refs followed by value refs
+            return False, ("dict", self._read_refs(pos, 2 * count))
+        # Unknown types decode to None, as they always have
+        return True, None
+
+    def decode(self, ref):
+        """Decodes the object with the given reference and everything it contains"""
+        memo = self.memo
+        if ref in memo:
+            return memo[ref]
+        # Each frame is (ref, kind, child refs) once its children are pushed
+        stack = [(ref, None, None)]
+        pending = set()
+        while stack:
+            ref, kind, children = stack.pop()
+            if kind is None:
+                if ref in memo:
+                    continue
+                if ref in pending:
+                    raise BplistError("Object {0} contains itself".format(ref))
+                is_scalar, value = self._read(ref)
+                if is_scalar:
+                    memo[ref] = value
+                    continue
+                kind, children = value
+                pending.add(ref)
+                stack.append((ref, kind, children))
+                for child in reversed(children):
+                    if child not in memo:
+                        stack.append((child, None, None))
             else:
-                int_type_byte = f.read(1)[0]
-            if int_type_byte & 0xF0 != 0x10:
-                raise BplistError("Long UTF-16 field definition not followed by int type at offset {0}".format(f.tell()))
-            int_length = 2 ** (int_type_byte & 0x0F)
-            int_bytes = f.read(int_length)
-            utf16_length = __decode_multibyte_int(int_bytes, False) * 2
-        return f.read(utf16_length).decode("utf_16_be")
-    elif type_byte & 0xF0 == 0x80: # UID    1000 nnnn
-        uid_length = (type_byte & 0x0F) + 1
-        uid_bytes = f.read(uid_length)
-        return BplistUID(__decode_multibyte_int(uid_bytes, signed=False))
-    elif type_byte & 0xF0 == 0xA0: # Array  1010 nnnn
-        if type_byte & 0x0F != 0x0F:
-            # length in 4 lsb
-            array_count = type_byte & 0x0F
+                pending.discard(ref)
+                if kind == "list":
+                    memo[ref] = [memo[child] for child in children]
+                else:
+                    count = len(children) // 2
+                    memo[ref] = dict((memo[children[i]], memo[children[count + i]]) for i in range(count))
+        return memo[ref]
+
+    def decode_top(self):
+        return self.decode(self.top_level_object_index)
+
+    def lazy(self, ref):
+        """Returns the object with the given reference, with arrays and dicts
+        as lazy views which only decode their items when accessed"""
+        if ref in self.views:
+            return self.views[ref]
+        if ref in self.memo:
+            return self.memo[ref]
+        is_scalar, value = self._read(ref)
+        if is_scalar:
+            self.memo[ref] = value
+            return value
+        kind, children = value
+        if kind == "list":
+            view = LazyPlistArray(self, children)
         else:
-            # A little hack to keep the script portable between py2.x and py3k
-            if sys.version_info[0] < 3:
-                int_type_byte = ord(f.read(1)[0])
-            else:
-                int_type_byte = f.read(1)[0]
-            if int_type_byte & 0xF0 != 0x10:
-                raise BplistError("Long Array field definition not followed by int type at offset {0}".format(f.tell()))
-            int_length = 2 ** (int_type_byte & 0x0F)
-            int_bytes = f.read(int_length)
-            array_count = __decode_multibyte_int(int_bytes, signed=False)
-        array_refs = []
-        for i in range(array_count):
-            array_refs.append(__decode_multibyte_int(f.read(collection_offset_size), False))
-        return [__decode_object(f, offset_table[obj_ref], collection_offset_size, offset_table) for obj_ref in array_refs]
-    elif type_byte & 0xF0 == 0xC0: # Set  1010 nnnn
-        if type_byte & 0x0F != 0x0F:
-            # length in 4 lsb
-            set_count = type_byte & 0x0F
-        else:
-            # A little hack to keep the script portable between py2.x and py3k
-            if sys.version_info[0] < 3:
-                int_type_byte = ord(f.read(1)[0])
-            else:
-                int_type_byte = f.read(1)[0]
-            if int_type_byte & 0xF0 != 0x10:
-                raise BplistError("Long Set field definition not followed by int type at offset {0}".format(f.tell()))
-            int_length = 2 ** (int_type_byte & 0x0F)
-            int_bytes = f.read(int_length)
-            set_count = __decode_multibyte_int(int_bytes, signed=False)
-        set_refs = []
-        for i in range(set_count):
-            set_refs.append(__decode_multibyte_int(f.read(collection_offset_size), False))
-        return [__decode_object(f, offset_table[obj_ref], collection_offset_size, offset_table) for obj_ref in set_refs]
-    elif type_byte & 0xF0 == 0xD0: # Dict  1011 nnnn
-        if type_byte & 0x0F != 0x0F:
-            # length in 4 lsb
-            dict_count = type_byte & 0x0F
-        else:
-            # A little hack to keep the script portable between py2.x and py3k
-            if sys.version_info[0] < 3:
-                int_type_byte = ord(f.read(1)[0])
-            else:
-                int_type_byte = f.read(1)[0]
-            #print("Dictionary length int byte: {0}".format(hex(int_type_byte)))
-            if int_type_byte & 0xF0 != 0x10:
-                raise BplistError("Long Dict field definition not followed by int type at offset {0}".format(f.tell()))
-            int_length = 2 ** (int_type_byte & 0x0F)
-            int_bytes = f.read(int_length)
-            dict_count = __decode_multibyte_int(int_bytes, signed=False)
-        key_refs = []
-        #print("Dictionary count: {0}".format(dict_count))
-        for i in range(dict_count):
-            key_refs.append(__decode_multibyte_int(f.read(collection_offset_size), False))
-        value_refs = []
-        for i in range(dict_count):
-            value_refs.append(__decode_multibyte_int(f.read(collection_offset_size), False))
-        
-        dict_result = {}
-        for i in range(dict_count):
-            #print("Key ref: {0}\tVal ref: {1}".format(key_refs[i], value_refs[i]))
-            key = __decode_object(f, offset_table[key_refs[i]], collection_offset_size, offset_table)
-            val = __decode_object(f, offset_table[value_refs[i]], collection_offset_size, offset_table)
-            dict_result[key] = val
-        return dict_result
+            count = len(children) // 2
+            view = LazyPlistDict(self, children[:count], children[count:])
+        self.views[ref] = view
+        return view
+
+    def lazy_top(self):
+        return self.lazy(self.top_level_object_index)
+
+
+class LazyPlistArray(object):
+    """An array (or set) of a binary plist whose items are decoded on access"""
+
+    def __init__(self, reader, refs):
+        self._reader = reader
+        self._refs = refs
+
+    def __len__(self):
+        return len(self._refs)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._reader.lazy(ref) for ref in self._refs[index]]
+        return self._reader.lazy(self._refs[index])
+
+    def __iter__(self):
+        for ref in self._refs:
+            yield self._reader.lazy(ref)
+
+    def __repr__(self):
+        return "<lazy plist array of {0} items>".format(len(self._refs))
+
+    def decode(self):
+        """Returns the whole array fully decoded"""
+        return [self._reader.decode(ref) for ref in self._refs]
+
+    def query(self, path):
+        return query(self, path)
+
+
+class LazyPlistDict(object):
+    """A dict of a binary plist whose values are decoded on access.
+    Keys are decoded the first time any key is looked up."""
+
+    def __init__(self, reader, key_refs, value_refs):
+        self._reader = reader
+        self._key_refs = key_refs
+        self._value_refs = value_refs
+        self._index = None
+
+    def _refs(self):
+        """Returns a dict from decoded key to value reference"""
+        if self._index is None:
+            self._index = dict((self._reader.decode(k), v) for k, v in zip(self._key_refs, self._value_refs))
+        return self._index
+
+    def __len__(self):
+        return len(self._refs())
+
+    def __contains__(self, key):
+        return key in self._refs()
+
+    def __getitem__(self, key):
+        return self._reader.lazy(self._refs()[key])
+
+    def __iter__(self):
+        return iter(self._refs())
+
+    def __repr__(self):
+        return "<lazy plist dict of {0} items>".format(len(self._value_refs))
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        return list(self._refs().keys())
+
+    def values(self):
+        return [self[k] for k in self._refs()]
+
+    def items(self):
+        return [(k, self[k]) for k in self._refs()]
+
+    def decode(self):
+        """Returns the whole dict fully decoded"""
+        return dict((k, self._reader.decode(v)) for k, v in self._refs().items())
+
+    def query(self, path):
+        return query(self, path)
 
 
+_PATH_STEP = re.compile(r"\[(-?\d+)\]|([^.\[\]]+)")
+
+def parse_path(path):
+    """Splits a key path such as "a[0].b" into its steps: ["a", 0, "b"]"""
+    return [int(index) if index else key for index, key in _PATH_STEP.findall(path)]
+
+def query(obj, path):
+    """Follows the given key path (a list of keys and indices, or a string
+    such as "a[0].b") from obj, decoding only the objects along the way
+    when obj is a lazy view"""
+    if not isinstance(path, (list, tuple)):
+        path = parse_path(path)
+    for step in path:
+        obj = obj[step]
+    return obj
+
+
+def loads(data):
+    """
+    Converts a byte string (or other buffer) containing a binary property list.
+    Returns a data structure representing the data in the property list
+    """
+    return _BplistReader(data).decode_top()
+
 def load(f):
     """
     Reads and converts a file-like object containing a binary property list.
     Takes a file-like object (must support reading and seeking) as an argument
     Returns a data structure representing the data in the property list
     """
-    # Check magic number
-    if f.read(8) != b"bplist00":
-        raise BplistError("Bad file header")
-
-    # Read trailer
-    f.seek(-32, os.SEEK_END)
-    trailer = f.read(32)
-    offset_int_size, collection_offset_size, object_count, top_level_object_index, offest_table_offset = struct.unpack(">6xbbQQQ", trailer)
-
-    # Read offset table
-    f.seek(offest_table_offset)
-    offset_table = []
-    for i in range(object_count):
-        offset_table.append(__decode_multibyte_int(f.read(offset_int_size), False))
-    
-    return __decode_object(f, offset_table[top_level_object_index], collection_offset_size, offset_table)
+    f.seek(0)
+    return loads(f.read())
+
+def loads_lazy(data):
+    """
+    Opens a byte string (or other buffer) containing a binary property list.
+    Returns the top level object with arrays and dicts as lazy views
+    (LazyPlistArray, LazyPlistDict) which only decode what is accessed
+    """
+    return _BplistReader(data).lazy_top()
+
+def load_lazy(f):
+    """
+    Reads a file-like object containing a binary property list, see loads_lazy
+    """
+    f.seek(0)
+    return loads_lazy(f.read())
 
 
 def NSKeyedArchiver_common_objects_convertor(o):
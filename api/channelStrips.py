@@ -0,0 +1,145 @@
+"""
+  Index of the mixer channel strips in a GarageBand ProjectData file.
+
+  Each channel strip ("Inst 1", "Audio 3", "Output 1-2", ...) is an OCuA chunk
+  holding the strip's name and volume, followed by one UCuA chunk per slot
+  (sends, instrument, plug-ins) up to the next chunk of another kind:
+
+    OCuA   name at 0x61, volume at name + 0x37
+    UCuA   first two: sends (level at data 0x18)
+    UCuA   third: instrument, preset name at header + 0x34
+    UCuA   ...  plug-ins, e.x. a "Gain" plug-in with its gain at data 0xd8
+
+  ChannelStripIndex walks the chunk list of a ChunkIndex once and maps
+  every strip name to its ChannelStrip, so mixer queries are dictionary
+  lookups instead of searches through the whole file.
+
+  If standalone, first argument is path to grageband project
+"""
+
+import sys
+import mmap
+import struct
+import pprint
+
+import chunkIndex
+
+STRIP_TAG = b"OCuA"
+SLOT_TAG = b"UCuA"
+SLOT_KEY = b"\x55\x43\x75\x41\x01\x00\x0e\x00\x00\x00\x24"
+
+NAME_OFFSET = 0x61
+NAME_LENGTH = 64
+VOLUME_OFFSET = 0x37
+SEND_OFFSET = 0x18
+PRESET_SLOT = 2
+PRESET_OFFSET = 0x34
+PRESET_LENGTH = 64
+GAIN_PLUGIN_NAME = b"Gain"
+GAIN_PLUGIN_OFFSET = 0xd8
+
+class ChannelStrip(object):
+  """
+    One channel strip: the offset of its OCuA chunk and of its UCuA slots
+  """
+
+  def __init__(self, pd, addr):
+    self.pd = pd
+    self.addr = addr
+    self.nameAddr = addr + NAME_OFFSET
+    self.name = chunkIndex.toText(pd[self.nameAddr:self.nameAddr+NAME_LENGTH].split(b"\x00")[0])
+    self.slots = []
+
+  def slotData(self):
+    """
+      Returns the data of the strip's slot chunks, in order
+    """
+    return [self.pd.chunkData(a) for a in self.slots \
+            if self.pd[a:a+len(SLOT_KEY)] == SLOT_KEY]
+
+  def volume(self):
+    """
+      Returns the strip's volume as stored next to its name
+    """
+    volume, = self.pd.unpack("<I", self.nameAddr+VOLUME_OFFSET)
+    return volume
+
+  def sends(self):
+    """
+      Returns the levels of the first two sends
+    """
+    data = self.slotData()
+    return tuple(struct.unpack_from("<L", d, SEND_OFFSET)[0] for d in data[:2])
+
+  def gainPlugin(self):
+    """
+      Returns the gain of the last gain plug-in on the strip or None
+    """
+    gain = None
+    for d in self.slotData():
+      if GAIN_PLUGIN_NAME in d:
+        gain, = struct.unpack_from("<f", d, GAIN_PLUGIN_OFFSET)
+    return gain
+
+  def preset(self):
+    """
+      Returns the name of the strip's instrument preset,
+      or None for strips without an instrument slot
+    """
+    if len(self.slots) <= PRESET_SLOT:
+      return None
+    p = self.slots[PRESET_SLOT] + PRESET_OFFSET
+    # hack to strip anything after a dot from preset name:
+    # apple loops generate tracks with .pst
+    end = self.pd.find(b'.', p, p + PRESET_LENGTH)
+    if end == -1:
+      end = p + PRESET_LENGTH
+    return chunkIndex.toText(self.pd[p:end].strip(b"\x00"))
+
+class ChannelStripIndex(object):
+  """
+    Every channel strip of a project, in file order and by name
+    (the first strip with a given name)
+  """
+
+  def __init__(self, pd):
+    self.pd = chunkIndex.getIndex(pd)
+    self.strips = []
+    self.byName = {}
+    strip = None
+    for addr in self.pd.offsets:
+      tag = self.pd[addr:addr+chunkIndex.CHUNK_TAG_LENGTH]
+      if tag == STRIP_TAG:
+        strip = ChannelStrip(self.pd, addr)
+        self.strips.append(strip)
+        self.byName.setdefault(strip.name, strip)
+      elif tag == SLOT_TAG and strip is not None:
+        strip.slots.append(addr)
+      else:
+        strip = None
+
+  def get(self, name):
+    """
+      Returns the channel strip with the given name or None
+    """
+    return self.byName.get(name)
+
+def getStrips(pd):
+  """
+    Returns the channel strip index of the given ProjectData,
+    built once per ChunkIndex
+  """
+  pd = chunkIndex.getIndex(pd)
+  if "channelStrips" not in pd.cache:
+    pd.cache["channelStrips"] = ChannelStripIndex(pd)
+  return pd.cache["channelStrips"]
+
+def main():
+  with open(sys.argv[1],'r+b') as f:
+    mm = chunkIndex.ChunkIndex(mmap.mmap(f.fileno(),0))
+    for strip in getStrips(mm).strips:
+      if strip.slots:
+        pprint.pprint((strip.name, strip.volume(), strip.sends(), strip.gainPlugin(), strip.preset()))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,238 @@
+"""
+  Single pass index over the chunks of a GarageBand ProjectData file.
+
+  ProjectData is a sequence of chunks, each starting with a 36 byte header:
+
+    0x00  4 bytes   tag (e.x. "qSvE", "qeSM", "karT", "ivnE", "UCuA", "OCuA")
+    0x04  2 bytes   version
+    0x06  2 bytes   kind
+    0x0a  4 bytes   id
+    0x1c  8 bytes   size of the data following the header
+
+  ChunkIndex walks this framing once and maps tags and ids to header offsets
+  so extractors can look chunks up instead of searching the whole file.
+  The same sweep pairs each region's qeSM header with its qSvE body so
+  event chunks can be fetched by id in constant time.
+  A ChunkIndex can be used anywhere an mmap'ed ProjectData is expected:
+  slicing, len() and find() are passed through to the underlying file.
+
+  ProjectData is treated as bytes on both Python 2 and 3: fields are read
+  with struct.unpack_from at their offsets, single bytes are compared as
+  ints (see byteAt) and names are turned into text with toText.
+"""
+
+import bisect
+import struct
+import sys
+import mmap
+import pprint
+
+import chunkSchema
+
+CHUNK_HEADER = chunkSchema.CHUNK_HEADER
+FILE_HEADER_SIZE = 0x18
+CHUNK_HEADER_SIZE = CHUNK_HEADER.size
+CHUNK_SIZE_OFFSET = CHUNK_HEADER.offsets["size"]
+CHUNK_TAG_LENGTH = 4
+CHUNK_KEY_LENGTH = 14
+CHUNK_ID_OFFSET = CHUNK_HEADER.offsets["id"]
+
+EVENT_HEADER_PREFIX = b"\x71\x65\x53\x4d\x02\x00\x17\x00\x00\x00"
+EVENT_BODY_PREFIX = b"\x71\x53\x76\x45\x01\x00\x17\x00\x00\x00"
+
+def byteAt(data, offset):
+  """
+    Returns the byte at offset of data as an int
+  """
+  if isinstance(data, ChunkIndex):
+    data = data.pd
+  value, = struct.unpack_from("B", data, offset)
+  return value
+
+def toText(raw):
+  """
+    Returns a name read from the file as text: the byte string itself on
+    Python 2, decoded as utf-8 on Python 3
+  """
+  if isinstance(raw, str):
+    return raw
+  return raw.decode("utf-8", "replace")
+
+def bufferView(data, start, end):
+  """
+    Returns a read only window on data[start:end] without copying it:
+    a memoryview where data supports one, otherwise a buffer (py2 mmap)
+  """
+  try:
+    return memoryview(data)[start:end]
+  except TypeError:
+    return buffer(data, start, end - start)
+
+def viewBytes(view, start, end):
+  """
+    Copies view[start:end] out of a window from bufferView as a byte string
+  """
+  piece = view[start:end]
+  if isinstance(piece, memoryview):
+    return piece.tobytes()
+  return piece
+
+def getIndex(pd):
+  """
+    Returns pd if it is already indexed, otherwise builds a new ChunkIndex over it
+  """
+  if isinstance(pd, ChunkIndex):
+    return pd
+  return ChunkIndex(pd)
+
+class ChunkIndex:
+  """
+    Offsets of every chunk header in a ProjectData file, grouped by tag
+    and by full key (tag, version, kind and id).
+    events maps each event id to a tuple:
+      (qeSM header offset, qSvE body offset, body size)
+    cache holds indexes built on top of this one (e.x. channelStrips.getStrips)
+  """
+
+  def __init__(self, pd):
+    self.pd = pd
+    self.offsets = []
+    self.sizes = {}
+    self.tags = {}
+    self.keys = {}
+    self.events = {}
+    self.cache = {}
+    headers = {}
+    addr = FILE_HEADER_SIZE
+    end = len(pd)
+    while addr + CHUNK_HEADER_SIZE <= end:
+      size = CHUNK_HEADER.field(pd, "size", addr)
+      if addr + CHUNK_HEADER_SIZE + size > end:
+        break
+      self.offsets.append(addr)
+      self.sizes[addr] = size
+      self.tags.setdefault(pd[addr:addr+CHUNK_TAG_LENGTH], []).append(addr)
+      key = pd[addr:addr+CHUNK_KEY_LENGTH]
+      self.keys.setdefault(key, []).append(addr)
+      # Pair the first header of each event id with the first body after it
+      eventID = key[CHUNK_ID_OFFSET:]
+      if key[:CHUNK_ID_OFFSET] == EVENT_HEADER_PREFIX:
+        headers.setdefault(eventID, addr)
+      elif key[:CHUNK_ID_OFFSET] == EVENT_BODY_PREFIX and eventID in headers:
+        if eventID not in self.events:
+          self.events[eventID] = (headers[eventID], addr, size)
+      addr += CHUNK_HEADER_SIZE + size
+
+  #
+  # Pass through to the underlying ProjectData
+  #
+
+  def __getitem__(self, key):
+    return self.pd[key]
+
+  def __len__(self):
+    return len(self.pd)
+
+  def unpack(self, fmt, addr):
+    """
+      Unpacks the struct fmt at the given file offset without slicing
+    """
+    return struct.unpack_from(fmt, self.pd, addr)
+
+  def find(self, sub, *args):
+    return self.pd.find(sub, *args)
+
+  def rfind(self, sub, *args):
+    return self.pd.rfind(sub, *args)
+
+  #
+  # Chunk lookups
+  #
+
+  def _candidates(self, prefix):
+    """
+      Returns the sorted header offsets which could start with prefix
+    """
+    if len(prefix) >= CHUNK_KEY_LENGTH:
+      return self.keys.get(prefix[:CHUNK_KEY_LENGTH], [])
+    return self.tags.get(prefix[:CHUNK_TAG_LENGTH], [])
+
+  def findChunks(self, prefix, start = 0, end = None):
+    """
+      Returns the offsets of all chunk headers beginning with prefix
+      which start in [start, end)
+    """
+    candidates = self._candidates(prefix)
+    i = bisect.bisect_left(candidates, start)
+    result = []
+    for addr in candidates[i:]:
+      if end is not None and addr >= end:
+        break
+      if self.pd[addr:addr+len(prefix)] == prefix:
+        result.append(addr)
+    return result
+
+  def findChunk(self, prefix, start = 0, end = None):
+    """
+      Returns the offset of the first chunk header beginning with prefix
+      at or after start, or -1 if there is none
+    """
+    candidates = self._candidates(prefix)
+    i = bisect.bisect_left(candidates, start)
+    for addr in candidates[i:]:
+      if end is not None and addr >= end:
+        break
+      if self.pd[addr:addr+len(prefix)] == prefix:
+        return addr
+    return -1
+
+  def getEvent(self, eventID):
+    """
+      Returns (qeSM header offset, qSvE body offset, body size) for the event
+      with the given 4 byte id, or None if there is no such event
+    """
+    return self.events.get(eventID)
+
+  def chunkSize(self, addr):
+    """
+      Returns the data size declared by the chunk header at addr
+    """
+    return self.sizes[addr]
+
+  def chunkEnd(self, addr):
+    """
+      Returns the offset just past the data of the chunk at addr
+    """
+    return addr + CHUNK_HEADER_SIZE + self.sizes[addr]
+
+  def chunkData(self, addr):
+    """
+      Returns the data (without header) of the chunk at addr
+    """
+    return self.pd[addr+CHUNK_HEADER_SIZE:self.chunkEnd(addr)]
+
+  def chunkView(self, addr):
+    """
+      Returns a zero copy window (see bufferView) on the header and data of
+      the chunk at addr
+    """
+    return bufferView(self.pd, addr, self.chunkEnd(addr))
+
+  def chunkAt(self, addr):
+    """
+      Returns the offset of the chunk header containing the given file offset,
+      or -1 if addr falls before the first chunk
+    """
+    i = bisect.bisect_right(self.offsets, addr) - 1
+    if i < 0:
+      return -1
+    return self.offsets[i]
+
+def main():
+  with open(sys.argv[1], 'r+b') as f:
+    pd = mmap.mmap(f.fileno(), 0)
+    index = ChunkIndex(pd)
+    pprint.pprint(dict((k, len(v)) for k, v in index.tags.items()))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,246 @@
+"""
+  Registry of the chunk and record layouts of a GarageBand ProjectData file.
+
+  A RecordSchema lists the fields of a fixed size record as
+  (name, struct format, offset) and is compiled once into:
+
+    struct    -> a struct.Struct over the whole record (padded to its size),
+                 holding the fields which don't overlap an earlier one
+    fields    -> a struct.Struct per field, for reading single fields
+    dtype     -> a numpy dtype with every field (built on first use)
+
+  so decoders read records with unpack_from at their offsets, or a whole
+  record array at once with unpackAll (struct.iter_unpack where available)
+  or records (numpy.frombuffer).
+
+  A ChunkSchema names a chunk by the tag its header starts with, the record
+  its data is made of and the offset of the first record from the start of
+  the chunk header.
+
+  Schemas are registered by name, e.x. getSchema("transposition").
+
+  Dependencies:
+    numpy -> only for RecordSchema.dtype and RecordSchema.records
+"""
+
+import struct
+
+BYTE_ORDER = "<"
+
+# numpy equivalents of the struct formats used in the layouts
+NUMPY_FORMATS = {"B":"u1", "b":"i1", "H":"u2", "h":"i2", "I":"u4", "i":"i4",
+                 "L":"u4", "l":"i4", "Q":"u8", "q":"i8", "f":"f4", "d":"f8"}
+
+_registry = {}
+
+class RecordSchema(object):
+  """
+    Layout of a fixed size record
+  """
+
+  def __init__(self, name, size, fields):
+    """
+      fields is a list of (name, struct format, offset), e.x. ("size", "Q", 28)
+      Fields may overlap (e.x. a 64 bit view of a record's first 8 bytes),
+      those overlapping a field listed before them are left out of the
+      record struct
+    """
+    self.name = name
+    self.size = size
+    self.offsets = dict((f[0], f[2]) for f in fields)
+    self.formats = dict((f[0], f[1]) for f in fields)
+    self.fields = dict((f[0], struct.Struct(BYTE_ORDER + f[1])) for f in fields)
+    self.names = []
+    fmt = BYTE_ORDER
+    pos = 0
+    for fieldName, fieldFormat, offset in sorted(fields, key=lambda f: f[2]):
+      if offset < pos:
+        continue
+      if offset > pos:
+        fmt += "{}x".format(offset - pos)
+      fmt += fieldFormat
+      pos = offset + self.fields[fieldName].size
+      self.names.append(fieldName)
+    if pos > size:
+      raise ValueError("fields of {} run past its size".format(name))
+    if pos < size:
+      fmt += "{}x".format(size - pos)
+    self.struct = struct.Struct(fmt)
+    self._fieldList = fields
+    self._dtype = None
+
+  @property
+  def dtype(self):
+    """
+      numpy dtype of the record with every field at its offset
+    """
+    if self._dtype is None:
+      import numpy as np
+      formats = []
+      for fieldName, fieldFormat, offset in self._fieldList:
+        if fieldFormat[-1] == "s":
+          formats.append("S" + (fieldFormat[:-1] or "1"))
+        else:
+          formats.append(BYTE_ORDER + NUMPY_FORMATS[fieldFormat])
+      self._dtype = np.dtype({
+          "names":[f[0] for f in self._fieldList],
+          "formats":formats,
+          "offsets":[f[2] for f in self._fieldList],
+          "itemsize":self.size})
+    return self._dtype
+
+  def field(self, data, name, offset = 0):
+    """
+      Returns the named field of the record at offset in data
+    """
+    return self.fields[name].unpack_from(data, offset + self.offsets[name])[0]
+
+  def unpack(self, data, offset = 0):
+    """
+      Returns the record at offset in data as a tuple ordered like names
+    """
+    return self.struct.unpack_from(data, offset)
+
+  def count(self, length, start = 0):
+    """
+      Returns the number of whole records fitting in length bytes from start
+    """
+    return max(0, (length - start) // self.size)
+
+  def countWhile(self, data, name, accept, start = 0):
+    """
+      Returns the number of consecutive records from start whose named
+      field passes accept, stopping at the first which doesn't or which
+      doesn't fit whole in data
+    """
+    fieldStruct = self.fields[name]
+    offset = start
+    while offset + self.size <= len(data) \
+          and accept(fieldStruct.unpack_from(data, offset + self.offsets[name])[0]):
+      offset += self.size
+    return (offset - start) // self.size
+
+  def unpackAll(self, data, start = 0, count = None):
+    """
+      Decodes count records (default: all which fit) from start in one
+      sweep, returns a list of tuples ordered like names
+    """
+    if count is None:
+      count = self.count(len(data), start)
+    if hasattr(self.struct, "iter_unpack"):
+      try:
+        view = memoryview(data)[start:start+count*self.size]
+      except TypeError:
+        pass
+      else:
+        return list(self.struct.iter_unpack(view))
+    unpack = self.struct.unpack_from
+    return [unpack(data, start + i*self.size) for i in range(count)]
+
+  def records(self, data, start = 0, count = None):
+    """
+      Returns count records (default: all which fit) from start as a numpy
+      record array sharing data's memory
+    """
+    import numpy as np
+    if count is None:
+      count = self.count(len(data), start)
+    return np.frombuffer(data, dtype=self.dtype, count=count, offset=start)
+
+class ChunkSchema(object):
+  """
+    Layout of a chunk: the tag its header starts with and the records
+    its data is made of
+  """
+
+  def __init__(self, name, tag, record = None, dataOffset = None):
+    self.name = name
+    self.tag = tag
+    self.record = record
+    self.dataOffset = CHUNK_HEADER.size if dataOffset is None else dataOffset
+
+def register(schema):
+  """
+    Adds a chunk schema to the registry, returns it
+  """
+  _registry[schema.name] = schema
+  return schema
+
+def getSchema(name):
+  """
+    Returns the registered chunk schema with the given name
+  """
+  return _registry[name]
+
+def schemas():
+  """
+    Returns the names of all registered chunk schemas
+  """
+  return sorted(_registry.keys())
+
+#
+# Record layouts
+#
+
+# Header of every chunk
+CHUNK_HEADER = RecordSchema("chunkHeader", 36, [
+    ("tag", "4s", 0),
+    ("version", "H", 4),
+    ("kind", "H", 6),
+    ("id", "4s", 10),
+    ("size", "Q", 28)])
+
+# Regions and audio loops placed on the tracks, ended by a record whose
+# first 8 bytes are END_OF_LIST
+ARR_EVENT = RecordSchema("arrEvent", 0x50, [
+    ("type", "H", 0x00),
+    ("head", "Q", 0x00),
+    ("start", "L", 0x04),
+    ("trackID", "B", 0x14),
+    ("loopTime", "L", 0x1c),
+    ("id", "4s", 0x20),
+    ("loopTag", "1s", 0x2c)])
+
+# Events of a region body. Note events take two records:
+# type, 7 byte time, velocity and pitch in the first, duration at 0x0c in the second.
+REGION_EVENT = RecordSchema("regionEvent", 16, [
+    ("type", "H", 0),
+    ("head", "Q", 0),
+    ("time", "Q", 4),
+    ("vel", "B", 11),
+    ("pitch", "B", 12),
+    ("tail", "L", 12)])
+
+# Sections of the arrangement track
+ARR_SECTION = RecordSchema("arrSection", 48, [
+    ("key", "I", 0x10),
+    ("length", "I", 0x1c)])
+
+# Header of an arrangement section's name, the text follows at 0x48
+ARR_TEXT_HEADER = RecordSchema("arrTextHeader", 0x48, [
+    ("key", "I", 10),
+    ("size", "I", 28),
+    ("kind", "B", 60)])
+
+# Points of the transposition track
+TRANS_POINT = RecordSchema("transPoint", 0x30, [
+    ("type", "B", 0x00),
+    ("time", "L", 0x04),
+    ("value", "H", 0x15)])
+
+END_OF_LIST = 0x3fffffff000000f1
+
+#
+# Chunk layouts
+#
+
+ARR_EVENTS = register(ChunkSchema("arrEvents", \
+    b"\x71\x53\x76\x45\x01\x00\x17\x00\x00\x00\x04", ARR_EVENT))
+REGION_EVENTS = register(ChunkSchema("regionEvents", \
+    b"\x71\x53\x76\x45\x01\x00\x17\x00\x00\x00", REGION_EVENT))
+ARR_SECTIONS = register(ChunkSchema("arrSections", \
+    b"\x71\x53\x76\x45\x01\x00\x05", ARR_SECTION))
+ARR_TEXT = register(ChunkSchema("arrText", \
+    b"\x71\x53\x78\x54\x01\x00\x20\x00\x00\x00", ARR_TEXT_HEADER, 0))
+TRANSPOSITION = register(ChunkSchema("transposition", \
+    b"\x71\x53\x76\x45\x01\x00\x19", TRANS_POINT))
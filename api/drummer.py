@@ -6,44 +6,50 @@
 import sys
 import io
 import mmap
-import ccl_bplist
-
-OgnSTag = "\x4f\x67\x6e\x53\x01"
-qeSMTag = "\x71\x65\x53\x4d\x02"
-
-# Convert objects of form UID: number to ints
-def UIDtoInt( uid ):
-  return int(str(uid)[4:])
-
-# Translates keys and objects of NSKeyedArchiver node into a dict
-# node is a dict with NS.keys and NS.objects
-# objList is the master '$objects' list
-def nodeToDict( node, objList ):
-  d = {}
-  for i, k in enumerate(node['NS.keys']):
-    d[objList[UIDtoInt(k)]] = objList[UIDtoInt(node['NS.objects'][i])]
-  return d
+import collections
+import chunkIndex
+import keyedArchive
+
+OgnSTag = b"\x4f\x67\x6e\x53\x01"
+qeSMTag = b"\x71\x65\x53\x4d\x02"
+
+# Keys from the archive's root to the drummer track states
+DRUMMER_TRACKS_PATH = ["genInstDrummerBaseModel.state", "drummerModelTrackStates"]
+
+# State of one drummer track as stored in the drummer info plist
+DrummerState = collections.namedtuple("DrummerState", \
+    ["trackID", "characterID", "genreID", "characterType", "usingProducerKit"])
+
+# Resolves the drummer track states in the drummer info plist given in data
+# returns a list of DrummerState
+def getDrummerStates( data ):
+  archive = keyedArchive.KeyedArchive( data )
+  tracks = archive.query(DRUMMER_TRACKS_PATH)
+  if tracks is None:
+    return []
+  result = []
+  for trackID, state in archive.items(tracks):
+    result.append(DrummerState(trackID, \
+        archive.get(state, 'selectedCharacterIdentifier'), \
+        archive.get(state, 'selectedGenreIdentifier'), \
+        archive.get(state, 'selectedPersistentCharacterTypeIdentifier'), \
+        archive.get(state, 'isUsingProducerKit')))
+  return result
 
 # Walks the drummer info plist given in data
-# returns a list of the selectedCharacterIdentifier for each drummer
+# returns a list of the selectedCharacterIdentifier for each drummer,
+# "$null" for a drummer without one
 def decodeDrummersPlist( data ):
-  pl = ccl_bplist.load( data )
-  rootID = UIDtoInt(pl['$top']['root'])
-  root = nodeToDict(pl['$objects'][rootID], pl['$objects'])
-  baseModel = nodeToDict(root['genInstDrummerBaseModel.state'], pl['$objects'])
-  drummers = nodeToDict(baseModel['drummerModelTrackStates'], pl['$objects'])
-  result = []
-  for k, v in drummers.items():
-    drummerInfo = nodeToDict(v, pl['$objects'])
-    result.append(drummerInfo['selectedCharacterIdentifier'])
-  return result
+  return [keyedArchive.NULL if state.characterID is None else state.characterID \
+      for state in getDrummerStates( data )]
 
 # Returns the drummers info plist as a byte string
 def getDrummerChunk( pd ):
-  OgnSAddr = pd.find(OgnSTag)
-  plistAddr = pd.find(b"bplist00", OgnSAddr)
-  qeSMAddr = pd.find(qeSMTag, plistAddr)
-  return pd[plistAddr:qeSMAddr].rstrip("\x00")
+  pd = chunkIndex.getIndex(pd)
+  OgnSAddr = pd.findChunk(OgnSTag)
+  plistAddr = pd.find(b"bplist00", OgnSAddr, pd.chunkEnd(OgnSAddr))
+  qeSMAddr = pd.findChunk(qeSMTag, plistAddr)
+  return pd[plistAddr:qeSMAddr].rstrip(b"\x00")
 
 def main():
   projectDataPath = sys.argv[1] + "/Alternatives/000/ProjectData"
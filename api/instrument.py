@@ -7,6 +7,9 @@
     preset directories. In this case we should be able to look for metadata
     about the loop instead.
 
+  The pickled instruments are loaded once per process into an index
+  (see getIndex) so lookups are dictionary hits.
+
   Improvements:
     reload the pickle if it doesn't exists
 """
@@ -19,18 +22,64 @@ import pickle
 GARAGEBAND_APP_PATH = "/Applications/GarageBand.app"
 INST_PATCHES_PATH = "Contents/Resources/Patches/Instrument"
 PICKLE_TARGET = "instruments"
+# Readable from both Python 2 and 3
+PICKLE_PROTOCOL = 2
+
+# Process wide InstrumentIndex, loaded on first lookup
+_index = None
+
+class InstrumentIndex(object):
+  """
+    GarageBand instrument patches with their category keywords,
+    and the reverse mapping from keyword to patch names
+  """
+
+  def __init__(self, instruments):
+    self.instruments = instruments
+    self.byKeyword = {}
+    for name, keywords in instruments.items():
+      for word in keywords:
+        self.byKeyword.setdefault(word, []).append(name)
+    for names in self.byKeyword.values():
+      names.sort()
+
+  def keywords(self, inst):
+    """
+      Returns a copy of the category keywords of the given instrument or None
+    """
+    keywords = self.instruments.get(inst)
+    if keywords is None:
+      return None
+    return list(keywords)
+
+  def patches(self, keyword):
+    """
+      Returns the sorted names of the instruments with the given category keyword
+    """
+    return list(self.byKeyword.get(keyword, []))
+
+def getIndex():
+  """
+    Returns the process wide instrument index, unpickling it on first use
+  """
+  global _index
+  if _index is None:
+    _index = InstrumentIndex(loadInstruments())
+  return _index
 
 def getInstrument(inst):
   """
     Looks up the given instrument in the pickled instruments file
     and returns its category key words
   """
-  instruments = loadInstruments()
-  if inst not in instruments.keys():
-    return None
-  else:
-    return instruments[inst]
-  
+  return getIndex().keywords(inst)
+
+def getInstrumentsWithKeyword(keyword):
+  """
+    Returns the names of the instruments in the given category
+  """
+  return getIndex().patches(keyword)
+
 
 def getInstrumentPatches():
   """
@@ -60,17 +109,22 @@ def dumpInstruments():
   """
     Pickles a dictionary of GarageBand instruments at the given filepath
   """
+  global _index
   fp = getPicklePath()
-  with open(fp,'w') as f:
-    pickle.dump(getInstrumentPatches(), f)
+  with open(fp,'wb') as f:
+    pickle.dump(getInstrumentPatches(), f, PICKLE_PROTOCOL)
+  _index = None
 
 def loadInstruments():
   """
     Unpickles and returns stored GarageBand instruments dictionary
   """
   fp = getPicklePath()
-  with open(fp,"r") as f:
-    return pickle.load(f)
+  with open(fp,"rb") as f:
+    if sys.version_info[0] < 3:
+      return pickle.load(f)
+    # Names were pickled as Python 2 byte strings
+    return pickle.load(f, encoding="utf-8")
 
 def main():
   """
@@ -0,0 +1,128 @@
+"""
+  Resolves values in NSKeyedArchiver binary plists without decoding the
+  whole archive.
+
+  An archive is a bplist with a flat "$objects" array; objects refer to each
+  other by UID (an index into "$objects"). NSDictionary objects are stored as
+  parallel "NS.keys" / "NS.objects" arrays of UIDs and NSArray objects as an
+  "NS.objects" array of UIDs.
+
+  KeyedArchive opens the plist as lazy views (see ccl_bplist.loads_lazy) and
+  follows UIDs only along the keys asked for, e.x.
+
+    archive = KeyedArchive(data)
+    states = archive.query(["genInstDrummerBaseModel.state", "drummerModelTrackStates"])
+    for key, state in archive.items(states):
+      print(archive.get(state, "selectedCharacterIdentifier"))
+
+  Resolved objects and dictionary key maps are memoized by UID.
+
+  Dependencies:
+    ccl_bplist.py, CCL Forensics
+"""
+
+import ccl_bplist
+
+ARCHIVERS = ("NSKeyedArchiver", "NRKeyedArchiver")
+NULL = "$null"
+
+class KeyedArchive(object):
+  """
+    Lazily resolved NSKeyedArchiver archive
+  """
+
+  def __init__(self, data):
+    """
+      data is the archive as a byte string or a file-like object
+    """
+    if hasattr(data, "read"):
+      self.plist = ccl_bplist.load_lazy(data)
+    else:
+      self.plist = ccl_bplist.loads_lazy(data)
+    if not isinstance(self.plist, ccl_bplist.LazyPlistDict) \
+       or self.plist.get("$archiver") not in ARCHIVERS:
+      raise ValueError("not an NSKeyedArchiver archive")
+    self.objects = self.plist["$objects"]
+    self.resolved = {}
+    self.keyMaps = {}
+
+  def resolve(self, value):
+    """
+      Follows value if it is a UID and returns the object it refers to,
+      "$null" resolves to None
+    """
+    if isinstance(value, ccl_bplist.BplistUID):
+      uid = value.value
+      if uid not in self.resolved:
+        self.resolved[uid] = self.resolve(self.objects[uid])
+      return self.resolved[uid]
+    if value == NULL:
+      return None
+    return value
+
+  def root(self):
+    """
+      Returns the archive's root object
+    """
+    return self.resolve(self.plist["$top"]["root"])
+
+  def _keyMap(self, obj):
+    """
+      Returns a dict from resolved key to value UID for an archived NSDictionary
+    """
+    if id(obj) not in self.keyMaps:
+      self.keyMaps[id(obj)] = (obj, dict((self.resolve(k), v) \
+          for k, v in zip(obj["NS.keys"], obj["NS.objects"])))
+    return self.keyMaps[id(obj)][1]
+
+  def isDictionary(self, obj):
+    return isinstance(obj, ccl_bplist.LazyPlistDict) and "NS.keys" in obj
+
+  def isArray(self, obj):
+    return isinstance(obj, ccl_bplist.LazyPlistDict) and "NS.objects" in obj \
+           and "NS.keys" not in obj
+
+  def get(self, obj, key, default = None):
+    """
+      Returns the resolved value for key in obj: an entry of an archived
+      NSDictionary, an index into an archived NSArray or a field of any
+      other archived object
+    """
+    if self.isDictionary(obj):
+      keyMap = self._keyMap(obj)
+      if key not in keyMap:
+        return default
+      return self.resolve(keyMap[key])
+    if self.isArray(obj):
+      return self.resolve(obj["NS.objects"][key])
+    if key not in obj:
+      return default
+    return self.resolve(obj[key])
+
+  def keys(self, obj):
+    """
+      Returns the resolved keys of an archived NSDictionary
+      or the field names of any other archived object
+    """
+    if self.isDictionary(obj):
+      return [self.resolve(k) for k in obj["NS.keys"]]
+    return [k for k in obj.keys() if k != "$class"]
+
+  def items(self, obj):
+    """
+      Returns (key, resolved value) pairs of an archived object
+    """
+    return [(k, self.get(obj, k)) for k in self.keys(obj)]
+
+  def query(self, path, obj = None):
+    """
+      Follows the given list of keys from obj (default: the root object),
+      resolving only the objects along the way
+    """
+    if obj is None:
+      obj = self.root()
+    for key in path:
+      obj = self.get(obj, key)
+      if obj is None:
+        return None
+    return obj
@@ -5,6 +5,8 @@
 
   Dependencies: python-midi (https://github.com/vishnubob/python-midi.git)
                   -> for writeToMIDIFile()
+                numpy
+                  -> for decoding region bodies
 """
 import struct
 import sys
@@ -13,19 +15,26 @@ import pprint
 import os
 import argparse
 import heapq
-import copy
+import hashlib
 import re
 import instrument
+import chunkIndex
+import chunkSchema
+import noteTable
+import projectCache
 
 import midi
-
-ARR_HEADER_TAG = "\x71\x65\x53\x4d\x02\x00\x17\x00\x00\x00\x04"
-KART_TAG = "\x6b\x61\x72\x54\x04\x00\x17"
-IVNE_TAG_BASE = "\x69\x76\x6e\x45\x04\x00\x14\x00\x00\x00"
-ARRANGMENT_CHUNK_TAG = "\x71\x53\x76\x45\x01\x00\x17\x00\x00\x00\x04"
-EVENT_CHUNK_HEADER_TAG = "\x71\x65\x53\x4d\x02\x00\x17\x00\x00\x00"
-EVENT_CHUNK_TAG = "\x71\x53\x76\x45\x01\x00\x17\x00\x00\x00"
-END_OF_LIST_SENTINEL = "\xf1\x00\x00\x00\xff\xff\xff\x3f"
+import numpy as np
+
+ARR_HEADER_TAG = b"\x71\x65\x53\x4d\x02\x00\x17\x00\x00\x00\x04"
+KART_TAG = b"\x6b\x61\x72\x54\x04\x00\x17"
+IVNE_TAG_BASE = b"\x69\x76\x6e\x45\x04\x00\x14\x00\x00\x00"
+ARRANGMENT_CHUNK_TAG = chunkSchema.ARR_EVENTS.tag
+EVENT_CHUNK_HEADER_TAG = b"\x71\x65\x53\x4d\x02\x00\x17\x00\x00\x00"
+EVENT_CHUNK_TAG = chunkSchema.REGION_EVENTS.tag
+END_OF_LIST_SENTINEL = b"\xf1\x00\x00\x00\xff\xff\xff\x3f"
+END_OF_LIST_VALUE = chunkSchema.END_OF_LIST
+ARR_EVENT = chunkSchema.ARR_EVENT
 NO_LOOP_VALUE = 0x3FFFFFFF
 EVENT_START_TIME_OFFSET = 0x8700
 NOTE_START_TIME_OFFSET = 0x9600
@@ -39,8 +48,9 @@ def getTrackEntries(pd):
   """
     Returns karT arrangment header track entries
   """
-  arrAddr = pd.find(ARR_HEADER_TAG)
-  startAddr = pd.find(KART_TAG,arrAddr)
+  pd = chunkIndex.getIndex(pd)
+  arrAddr = pd.findChunk(ARR_HEADER_TAG)
+  startAddr = pd.findChunk(KART_TAG, arrAddr)
   karts = []
   while pd[startAddr:startAddr+7] == KART_TAG:
     karts.append(pd[startAddr:startAddr+0x5c])
@@ -52,8 +62,9 @@ def getLabelEntry(pd, labelID):
     Returns the label chunk for the given id
     by looking up the ivnE tag
   """
-  startAddr = pd.find(IVNE_TAG_BASE + labelID)
-  length, = struct.unpack("<L", pd[startAddr+28:startAddr+32])
+  pd = chunkIndex.getIndex(pd)
+  startAddr = pd.findChunk(IVNE_TAG_BASE + labelID)
+  length, = pd.unpack("<L", startAddr+28)
   return pd[startAddr+36:startAddr+36+length]
 
 def collectTrackLabels(pd):
@@ -66,8 +77,8 @@ def collectTrackLabels(pd):
   for t in arrTracks:
     tag = t[0x2c:0x2e]
     labelChunk = getLabelEntry(pd, tag)
-    nameLen, = struct.unpack("<H", labelChunk[0x9E:0xA0])
-    name = labelChunk[0xA0:0xA0+nameLen]
+    nameLen, = struct.unpack_from("<H", labelChunk, 0x9E)
+    name = chunkIndex.toText(labelChunk[0xA0:0xA0+nameLen])
     labels.append((name, tag))
   return labels
 
@@ -80,8 +91,9 @@ def getArrChunk(pd):
     Finds and returns the arrangment chunk from the given mmap'ed
     ProjectData file
   """
-  arrChunkAddr = pd.find(ARRANGMENT_CHUNK_TAG)
-  (chunkSize,) = struct.unpack("<Q", pd[arrChunkAddr+28:arrChunkAddr+36])
+  pd = chunkIndex.getIndex(pd)
+  arrChunkAddr = pd.findChunk(ARRANGMENT_CHUNK_TAG)
+  (chunkSize,) = pd.unpack("<Q", arrChunkAddr+28)
   return pd[arrChunkAddr+36:arrChunkAddr+36+chunkSize]
 
 def decodeArrChunk(arrChunk):
@@ -89,22 +101,22 @@ def decodeArrChunk(arrChunk):
     Breaks the given arrangment chunk into events
     returns a list of events
   """
-  events = []
-  offset = 0
-  while arrChunk[offset:offset+8] != END_OF_LIST_SENTINEL:
-    events.append(decodeArrEvent(arrChunk[offset:offset+0x50]))
-    offset += 0x50
-  return events
+  count = ARR_EVENT.countWhile(arrChunk, "head", lambda head: head != END_OF_LIST_VALUE)
+  return [arrEventDict(*values) for values in ARR_EVENT.unpackAll(arrChunk, 0, count)]
       
 
-def decodeArrEvent(e):
+def decodeArrEvent(e, offset = 0):
+  """
+    Interprits the arrangement chunk's event struct at offset in e
+  """
+  return arrEventDict(*ARR_EVENT.unpack(e, offset))
+
+def arrEventDict(eventType, startTime, trackID, loopTime, eventID, loopTag):
   """
-    Interprits the arrangement chunk's event structs
+    Builds the dict of an arrangement event from its ARR_EVENT fields
   """
-  eventType, startTime, trackID, loopTime, eventID = \
-     struct.unpack("<H 2x L 12x B 7x L 4s", e[0:36])
   loopTime = loopTime if loopTime != NO_LOOP_VALUE else None
-  loopTag = e[0x2c] if eventType == 36 else None
+  loopTag = loopTag if eventType == 36 else None
   # Normalize start times
   startTime -= EVENT_START_TIME_OFFSET
   return {"type":eventType, "start":startTime, "track_id":trackID, \
@@ -121,9 +133,15 @@ def getEventChunk(pd, eventID, startOffset = 0):
     Returns a tuple with first element as qeSM header chunk and second
     as qSvE body chunk
   """
-  eventHeaderAddr = pd.find(EVENT_CHUNK_HEADER_TAG + eventID, startOffset)
-  eventBodyAddr = pd.find(EVENT_CHUNK_TAG + eventID, eventHeaderAddr)
-  (chunkSize,) = struct.unpack("<Q", pd[eventBodyAddr+28:eventBodyAddr+36])
+  pd = chunkIndex.getIndex(pd)
+  event = pd.getEvent(eventID)
+  if event != None and event[0] >= startOffset:
+    eventHeaderAddr, eventBodyAddr, chunkSize = event
+    return (pd[eventHeaderAddr:eventBodyAddr], \
+            pd[eventBodyAddr+36:eventBodyAddr+36+chunkSize])
+  eventHeaderAddr = pd.findChunk(EVENT_CHUNK_HEADER_TAG + eventID, startOffset)
+  eventBodyAddr = pd.findChunk(EVENT_CHUNK_TAG + eventID, eventHeaderAddr)
+  (chunkSize,) = pd.unpack("<Q", eventBodyAddr+28)
   eventHeader = pd[eventHeaderAddr:eventBodyAddr]
   eventBody = pd[eventBodyAddr+36:eventBodyAddr+36+chunkSize]
   return (eventHeader, eventBody)
@@ -134,46 +152,58 @@ def decodeEventHeader(header):
     Pulls interesting data from the given event header
     Returns as a dictionary
   """
-  nameLength, = struct.unpack("<H", header[0x34:0x36])
+  nameLength, = struct.unpack_from("<H", header, 0x34)
   # subsiquent addresses are align 2
   nameLength = nameLength if nameLength % 2 == 0 else nameLength + 1
   startOffsetAddr = 0x3a + nameLength
   lengthAddr = 0x72 + nameLength
-  startOffset, = struct.unpack("<L", header[startOffsetAddr:startOffsetAddr+4])
-  length, = struct.unpack("<L", header[lengthAddr:lengthAddr+4])
+  startOffset, = struct.unpack_from("<L", header, startOffsetAddr)
+  length, = struct.unpack_from("<L", header, lengthAddr)
   return {"length":length, "start_offset":startOffset,\
-      "region_name":header[0x36:0x36+nameLength].strip('\x00')}
+      "region_name":chunkIndex.toText(header[0x36:0x36+nameLength].strip(b'\x00'))}
+
+NOTE_EVENT_TYPE = 0x90
+NOTE_TIME_MASK = np.uint64(0x00ffffffffffffff)
+# Event bodies are a list of 16 byte records, see chunkSchema.REGION_EVENT
+EVENT_RECORD_SIZE = chunkSchema.REGION_EVENT.size
+EVENT_RECORD_DTYPE = chunkSchema.REGION_EVENT.dtype
+
+def decodeEventColumns(body, startOffset):
+  """
+    Converts the data in the event body into note events
+    Returns a dict of numpy arrays with keys "time", "vel", "pitch", "duration"
+  """
+  records = chunkSchema.REGION_EVENT.records(body)
+  count = len(records)
+  isNote = records["type"] == NOTE_EVENT_TYPE
+  # A note's second record is not an event of its own, so in a run of note
+  # typed records only every other one starts a note
+  index = np.arange(count)
+  runStart = isNote & ~np.concatenate(([False], isNote[:-1]))
+  runStart = np.maximum.accumulate(np.where(runStart, index, 0)) if count else index
+  noteStart = isNote & ((index - runStart) % 2 == 0)
+  eventStart = ~np.concatenate(([False], noteStart[:-1]))
+  # Drop everything after the end of list sentinel and any note cut off by the end
+  ends = np.flatnonzero(eventStart & (records["head"] == END_OF_LIST_VALUE))
+  if len(ends):
+    noteStart[ends[0]:] = False
+  noteStart[count-1:] = False
+  starts = np.flatnonzero(noteStart)
+  time = (records["time"][starts] & NOTE_TIME_MASK).astype(np.int64)
+  time -= NOTE_START_TIME_OFFSET + startOffset
+  duration = records["tail"][starts + 1].astype(np.int64)
+  return {"time":time, "vel":records["vel"][starts], \
+          "pitch":records["pitch"][starts], "duration":duration}
 
 def decodeEventBody(body, startOffset):
   """
     Converts the data in the event body into note events
     Returns a list of dicts
   """
-  offset = 0
-  notes = []
-  bodyLen = len(body) - 4
-  while body[offset:offset+8] != END_OF_LIST_SENTINEL and offset < bodyLen:
-    if body[offset:offset+2] == "\xC0\x00":
-      # start of event marker: skipping for now
-      offset += 16
-    elif body[offset:offset+2] == "\xb0\x00":
-      # modulation or cc events: skipped
-      offset += 16
-    elif body[offset:offset+2] == "\xe0\x00":
-      # pitch bend events: skipped
-      offset += 16
-    elif body[offset:offset+2] == "\x90\x00":
-      # note event
-      time, vel, pitch, dur = struct.unpack("<7s B B 15x L",body[offset+4:offset+32])
-      # hack the 7 bytes into an 8 byte int
-      time, = struct.unpack("<Q", time + "\x00")
-      time -= NOTE_START_TIME_OFFSET + startOffset
-      notes.append({"time":time, "vel":vel, "pitch":pitch, "duration":dur})
-      offset += 32
-    else:
-      # Assume that things are 16 byte aligned so unknown sections will wrap at 16 bytes
-      offset += 16
-  return notes
+  c = decodeEventColumns(body, startOffset)
+  return [{"time":t, "vel":v, "pitch":p, "duration":d} for t, v, p, d in \
+          zip(c["time"].tolist(), c["vel"].tolist(), c["pitch"].tolist(), \
+              c["duration"].tolist())]
 
 #
 # Functions for healing with audio loops
@@ -185,10 +215,11 @@ def getLoopName(pd, tag):
   """
     Look up the name of the loop with the given tag
   """
-  headerAddr = pd.find(LFUAHeader + tag)
+  pd = chunkIndex.getIndex(pd)
+  headerAddr = pd.findChunk(LFUAHeader + tag)
   LFUAAddr = pd.find(LFUATag, headerAddr)
   nullAddr = pd.find(b"\x00", LFUAAddr + 10)
-  return pd[LFUAAddr + 10:nullAddr] #.strip("\x00")
+  return chunkIndex.toText(pd[LFUAAddr + 10:nullAddr])
 
 #
 # Auxilary functions for dealing with GarageBand features
@@ -200,80 +231,117 @@ def getCurrentTake(header, body):
     Basically we have the same structure as the arrangement header, body.
     Returns the eventID of the currently selected event.
   """
+  curEvent = None
   # Find a karT entry with 00 at position 0x27 -> the selected take
   startAddr = header.find(KART_TAG)
   while header[startAddr:startAddr+7] == KART_TAG:
     kart = header[startAddr:startAddr+0x5c]
-    if kart[0x27] == "\x00":
-      curEvent, = struct.unpack("B", kart[0x12])
+    if chunkIndex.byteAt(kart, 0x27) == 0:
+      curEvent = chunkIndex.byteAt(kart, 0x12)
       break
     startAddr += 0x5c
   # Just in case,
   if curEvent == None:
     return
   # Jump to the relevant chunk and grab the eventID
-  return body[0x50 * curEvent + 0x20]
+  eventAddr = 0x50 * curEvent + 0x20
+  return body[eventAddr:eventAddr+4]
 
 def cropNotes(notes, length):
   """
     Cuts off all notes after length or before time = 0
     Adjust last note's duration to make sure it doesn't exceed length
-    Returns the modified note list
-  """
-  startIndex = 0
-  endIndex = len(notes) - 1
-  while startIndex < endIndex and notes[startIndex]['time'] < 0:
-    startIndex += 1
-  while endIndex > 0 and notes[endIndex]['time'] >= length:
-    endIndex -= 1
-  for i in range(startIndex,endIndex+1):
-    if notes[i]['time'] + notes[i]['duration'] > length:
-      notes[i]['duration'] = length - notes[i]['time']
-  return notes[startIndex:endIndex+1]
+    Returns a new NoteTable
+  """
+  if len(notes) == 0:
+    return notes
+  # Leading notes before time = 0 are dropped, but at least one note is kept
+  inside = np.flatnonzero(notes.time >= 0)
+  startIndex = min(inside[0], len(notes) - 1) if len(inside) else len(notes) - 1
+  # Trailing notes at or after length are dropped
+  inside = np.flatnonzero(notes.time < length)
+  endIndex = max(inside[-1], 0) if len(inside) else 0
+  notes = notes[startIndex:endIndex+1]
+  notes.duration = np.minimum(notes.duration, length - notes.time)
+  return notes
 
 def loopNotes(notes, length, loopDuration):
   """
     Repeate the events between time = 0 and time = length until time = loopDuration
     Assumes the event has already been cropped (note times all between 0 and length)
-    Returns the modified note list
-  """
-  scope = len(notes)
-  i = 0
-  start = length
-  while notes[i]['time'] + start < loopDuration:
-    newNote = copy.copy(notes[i])
-    newNote['time'] += start
-    if newNote['time'] + newNote['duration'] > loopDuration:
-      newNote['duration'] = loopDuration - newNote['time']
-    notes.append(newNote)
-    i += 1
-    if i == scope:
-      i = 0
-      start += length
-  return notes
+    Returns a noteTable.LoopedNotes view: repetitions are computed on access
+  """
+  return noteTable.LoopedNotes(notes, length, loopDuration)
+
+class RegionDecoder(object):
+  """
+    Decodes the region bodies of one project once: regions are memoized by
+    event id, and by their start offset, length and a digest of their body
+    so copies of a region with identical bytes share one decode.
+    Decoded notes are cropped to the region and frozen (see NoteTable.freeze),
+    each region instance shifts and tags its own copy.
+  """
+
+  def __init__(self, pd):
+    self.pd = chunkIndex.getIndex(pd)
+    self.byEvent = {}
+    self.byDigest = {}
+
+  def get(self, eventID):
+    """
+      Returns (header dict, cropped NoteTable) of the region event with
+      the given id, or None for a multi-take region whose take is unknown
+    """
+    if eventID not in self.byEvent:
+      self.byEvent[eventID] = self._decode(eventID)
+    return self.byEvent[eventID]
+
+  def _decode(self, eventID):
+    h, b = getEventChunk(self.pd, eventID)
+    # Check if there are multiple takes
+    if chunkIndex.byteAt(b, 0) == 0x20:
+      curTake = getCurrentTake(h, b)
+      if curTake == None:
+        return None
+      h, b = getEventChunk(self.pd, curTake)
+    header = decodeEventHeader(h)
+    key = (header['start_offset'], header['length'], hashlib.sha1(b).digest())
+    if key not in self.byDigest:
+      notes = noteTable.NoteTable.fromColumns(decodeEventColumns(b, header['start_offset']))
+      self.byDigest[key] = cropNotes(notes, header['length']).freeze()
+    return (header, self.byDigest[key])
+
+def getRegions(pd):
+  """
+    Returns the region decoder of the given ProjectData,
+    built once per ChunkIndex
+  """
+  pd = chunkIndex.getIndex(pd)
+  if "regions" not in pd.cache:
+    pd.cache["regions"] = RegionDecoder(pd)
+  return pd.cache["regions"]
 
 def assembleTracks(pd, events):
   """
     Performs lookups, translations, and grouping of a list of region dictionaries
     Regions are merged into their tracks using the above crop function to handle notes
     which don't actually fall into the region boundaries.
+    Notes of each region are stored in a noteTable.NoteTable (or a LoopedNotes
+    view for looped regions) with the region column set to the region's index
+    in its track. Each track's notes are a noteTable.NoteStream of its regions.
+    Region bodies are decoded once per project (see RegionDecoder).
     Returns a list of track dictionaries
   """ 
+  pd = chunkIndex.getIndex(pd)
+  decoder = getRegions(pd)
   tracks = {}
   for e in events:
     if e['type'] == 32: # Instrument event
-      h, b = getEventChunk(pd, e['id'])
-      # Check if there are multiple takes
-      if b[0] == "\x20":
-        curTake = getCurrentTake(h, b)
-        if curTake != None:
-          h, b = getEventChunk(pd, curTake)
-        else: # Give up
-          print("Dropped multi-take region tagged {}".format(hex(e['id'])))
-          continue
-      header = decodeEventHeader(h)
-      notes = decodeEventBody(b, header['start_offset'])
-      notes = cropNotes(notes, header['length'])
+      region = decoder.get(e['id'])
+      if region is None: # Give up on multi-take regions without a take
+        print("Dropped multi-take region tagged {}".format(hex(e['id'])))
+        continue
+      header, notes = region
       regionLength = header['length']
       if e['loop_time'] != None:
         notes = loopNotes(notes, header['length'], e['loop_time'])
@@ -282,13 +350,12 @@ def assembleTracks(pd, events):
       if e['track_id'] not in tracks.keys():
         tracks[e['track_id']] = {'notes':[], 'type':'instrument', 'regions':[]}
       # Add region data
-      tracks[e['track_id']]['regions'].append({'name':header['region_name'], \
+      regions = tracks[e['track_id']]['regions']
+      notes = notes.withRegion(len(regions))
+      regions.append({'name':header['region_name'], \
           'start':e['start'], 'length':regionLength, 'notes':notes})
       # Add note stream
-      for n in notes:
-        newNote = copy.copy(n)
-        newNote['time'] += e['start'] # add event start time to note start times
-        tracks[e['track_id']]['notes'].append(newNote)
+      tracks[e['track_id']]['notes'].append(notes.shift(e['start']))
     elif e['type'] == 36: # Audio event
       # set up a new track if needed
       if e['track_id'] not in tracks.keys():
@@ -298,6 +365,9 @@ def assembleTracks(pd, events):
                 'name':getLoopName(pd, e['loop_tag'])})
     else:
       print("Unknown track type: {}".format(e['type']))
+  for t in tracks.values():
+    if 'notes' in t:
+      t['notes'] = noteTable.NoteStream(t['notes'])
   # Add track labels and convert tracks into list
   labels = collectTrackLabels(pd)
   for i, l in enumerate(labels):
@@ -370,15 +440,28 @@ def getTracks(pd):
   """
     Convenience method to return all track data in a dict strucure
   """
+  pd = chunkIndex.getIndex(pd)
   events = decodeArrChunk(getArrChunk(pd))
   tracks = assembleTracks(pd, events)
   return tracks
 
 def makeTracks(filepath):
-  mm = getProjectData(filepath)
+  """
+    Returns all track data of the project at filepath,
+    going through the project cache (see projectCache.py)
+  """
+  key = None
+  if projectCache.enabled():
+    key = projectCache.projectKey(filepath)
+    entry = projectCache.get(key) or {}
+    if 'tracks' in entry:
+      return entry['tracks']
+  mm = chunkIndex.ChunkIndex(getProjectData(filepath))
   events = decodeArrChunk(getArrChunk(mm))
   tracks = assembleTracks(mm, events)
-
+  if key is not None:
+    entry['tracks'] = tracks
+    projectCache.put(key, entry)
   return tracks
 
 def main():
@@ -386,7 +469,7 @@ def main():
   parser.add_argument('filepath',help="Path to GarageBand project directory")
   parser.add_argument('-o',help="Dump here as MIDI file", metavar="outfile")
   args = parser.parse_args()
-  mm = getProjectData(args.filepath)
+  mm = chunkIndex.ChunkIndex(getProjectData(args.filepath))
   events = decodeArrChunk(getArrChunk(mm))
   tracks = assembleTracks(mm, events)
   if args.o != None:
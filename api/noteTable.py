@@ -0,0 +1,402 @@
+"""
+  Columnar storage for note events.
+
+  A NoteTable keeps the notes of a region or track as parallel numpy arrays
+  instead of a list of dicts:
+
+    time      -> start time in ticks (int64)
+    duration  -> length in ticks (int64)
+    pitch     -> MIDI pitch (uint8)
+    vel       -> MIDI velocity (uint8)
+    region    -> index of the region in its track's region list (int32)
+
+  Slicing, boolean masks and index arrays return new NoteTables, so checks can
+  be written as array expressions over table.pitch, table.duration, etc.
+  Indexing with an int or iterating yields note dicts with keys
+  "time", "vel", "pitch", "duration" for code which still expects them.
+
+  Two lazy views share the same interface:
+
+    LoopedNotes -> a looped region stored as its base pattern, loop period
+                   and end. Note times are computed when indexed and
+                   between() only builds the repetitions it overlaps.
+    NoteStream  -> a track's note stream as a list of region parts.
+
+  Reading a column (e.x. stream.pitch) on a view expands it once into a
+  NoteTable (see expand()); range queries do not.
+
+  Range queries (between(), countBetween()) go through a time index: each
+  table keeps its notes' start times sorted (built on first query), so a
+  query is two binary searches instead of a scan. The index is rebuilt when
+  a table's time column is reassigned; columns must not be changed in place.
+"""
+
+import bisect
+import itertools
+
+import numpy as np
+
+def _expandedColumn(name):
+  """
+    Returns a read only property giving the named column of self.expand()
+  """
+  return property(lambda self: getattr(self.expand(), name))
+
+class NoteTable(object):
+  """
+    Notes stored as parallel typed arrays
+  """
+
+  def __init__(self, time = (), vel = (), pitch = (), duration = (), region = None):
+    self.time = np.asarray(time, dtype=np.int64)
+    self.vel = np.asarray(vel, dtype=np.uint8)
+    self.pitch = np.asarray(pitch, dtype=np.uint8)
+    self.duration = np.asarray(duration, dtype=np.int64)
+    if region is None:
+      region = np.zeros(len(self.time), dtype=np.int32)
+    self.region = np.asarray(region, dtype=np.int32)
+
+  @classmethod
+  def fromColumns(cls, columns, region = 0):
+    """
+      Builds a table from a dict of arrays as returned by
+      midiDump.decodeEventColumns, tagging every note with the given region
+    """
+    return cls(columns["time"], columns["vel"], columns["pitch"], \
+               columns["duration"], np.full(len(columns["time"]), region, dtype=np.int32))
+
+  @classmethod
+  def fromDicts(cls, notes):
+    """
+      Builds a table from a list of note dicts
+    """
+    return cls([n["time"] for n in notes], [n["vel"] for n in notes], \
+               [n["pitch"] for n in notes], [n["duration"] for n in notes])
+
+  @classmethod
+  def concat(cls, tables):
+    """
+      Joins the given tables end to end
+    """
+    if len(tables) == 0:
+      return cls()
+    return cls(np.concatenate([t.time for t in tables]), \
+               np.concatenate([t.vel for t in tables]), \
+               np.concatenate([t.pitch for t in tables]), \
+               np.concatenate([t.duration for t in tables]), \
+               np.concatenate([t.region for t in tables]))
+
+  def __len__(self):
+    return len(self.time)
+
+  def __getitem__(self, key):
+    """
+      An int returns a note dict, anything numpy can index with
+      (slice, boolean mask, index array) returns a new NoteTable
+    """
+    if isinstance(key, (int, np.integer)):
+      return {"time":int(self.time[key]), "vel":int(self.vel[key]), \
+              "pitch":int(self.pitch[key]), "duration":int(self.duration[key])}
+    return NoteTable(self.time[key], self.vel[key], self.pitch[key], \
+                     self.duration[key], self.region[key])
+
+  def __iter__(self):
+    for i in range(len(self)):
+      yield self[i]
+
+  def __repr__(self):
+    return repr(self.toDicts())
+
+  def expand(self):
+    """
+      Returns the notes as a NoteTable: a table is already expanded
+    """
+    return self
+
+  def toDicts(self):
+    """
+      Returns the notes as a list of dicts
+    """
+    return [{"time":t, "vel":v, "pitch":p, "duration":d} for t, v, p, d in \
+            zip(self.time.tolist(), self.vel.tolist(), self.pitch.tolist(), \
+                self.duration.tolist())]
+
+  def shift(self, offset):
+    """
+      Returns a copy of the table with offset added to every start time
+    """
+    return NoteTable(self.time + offset, self.vel, self.pitch, self.duration, self.region)
+
+  def withRegion(self, region):
+    """
+      Returns a copy of the table with every note tagged as the given region
+    """
+    return NoteTable(self.time, self.vel, self.pitch, self.duration, \
+                     np.full(len(self), region, dtype=np.int32))
+
+  def freeze(self):
+    """
+      Makes the table's columns read only so it can be shared, returns it
+    """
+    for column in (self.time, self.vel, self.pitch, self.duration, self.region):
+      column.flags.writeable = False
+    return self
+
+  def __getstate__(self):
+    # The time index is only a cache: don't pickle it
+    state = dict(self.__dict__)
+    state.pop("_timeIndex", None)
+    return state
+
+  def timeIndex(self):
+    """
+      Returns (order, sortedTime): the permutation sorting the notes by start
+      time and the sorted start times. order is None if the notes are
+      already in time order.
+    """
+    index = self.__dict__.get("_timeIndex")
+    if index is None or index[0] is not self.time:
+      if np.all(self.time[1:] >= self.time[:-1]):
+        order, sortedTime = None, self.time
+      else:
+        order = np.argsort(self.time, kind="mergesort")
+        sortedTime = self.time[order]
+      index = (self.time, order, sortedTime)
+      self._timeIndex = index
+    return index[1], index[2]
+
+  def _timeRange(self, start, end):
+    """
+      Returns (order, lo, hi) such that the notes starting in [start, end)
+      are sortedTime[lo:hi]; a bound of None is unbounded
+    """
+    order, sortedTime = self.timeIndex()
+    lo = 0 if start is None else int(np.searchsorted(sortedTime, start, "left"))
+    hi = len(sortedTime) if end is None else int(np.searchsorted(sortedTime, end, "left"))
+    return order, lo, max(lo, hi)
+
+  def between(self, start = None, end = None):
+    """
+      Returns the notes starting in [start, end), in their original order
+      A bound of None is unbounded
+    """
+    order, lo, hi = self._timeRange(start, end)
+    if order is None:
+      return self[lo:hi]
+    return self[np.sort(order[lo:hi])]
+
+  def countBetween(self, start = None, end = None):
+    """
+      Returns the number of notes starting in [start, end)
+    """
+    order, lo, hi = self._timeRange(start, end)
+    return hi - lo
+
+class LoopedNotes(object):
+  """
+    A region looped until a given end time, without copying its notes.
+    Repetition 0 is the base pattern as is. Repetition k starts k periods
+    later with durations cut at end, and the loop stops at the first
+    repeated note which would start at or after end.
+  """
+
+  def __init__(self, base, period, end, offset = 0):
+    self.base = base
+    self.period = period
+    self.end = end
+    self.offset = offset
+    self._table = None
+    n = len(base)
+    if n == 0 or period <= 0:
+      self.fullReps = 0
+      self.count = n
+      return
+    # Repetitions after the base which fit completely before end
+    self.fullReps = max(0, (end - int(base.time.max()) - 1) // period)
+    # Notes of the next repetition up to the first one past end
+    late = np.flatnonzero(base.time + (self.fullReps + 1) * period >= end)
+    self.count = n * (self.fullReps + 1) + int(late[0])
+
+  def __len__(self):
+    return self.count
+
+  def __getstate__(self):
+    # The expanded table is only a cache: don't pickle it
+    state = dict(self.__dict__)
+    state["_table"] = None
+    return state
+
+  def _rows(self, indices):
+    """
+      Returns the notes at the given flat indices as a NoteTable
+    """
+    n = len(self.base)
+    rep = indices // n
+    j = indices % n
+    time = self.base.time[j] + rep * self.period
+    duration = self.base.duration[j]
+    duration = np.where(rep > 0, np.minimum(duration, self.end - time), duration)
+    return NoteTable(time + self.offset, self.base.vel[j], self.base.pitch[j], \
+                     duration, self.base.region[j])
+
+  def expand(self):
+    """
+      Returns every note of the loop as a NoteTable
+    """
+    if self._table is None:
+      self._table = self._rows(np.arange(self.count, dtype=np.int64))
+    return self._table
+
+  time = _expandedColumn("time")
+  vel = _expandedColumn("vel")
+  pitch = _expandedColumn("pitch")
+  duration = _expandedColumn("duration")
+  region = _expandedColumn("region")
+
+  def __getitem__(self, key):
+    if isinstance(key, (int, np.integer)):
+      if key < 0:
+        key += self.count
+      if key < 0 or key >= self.count:
+        raise IndexError("note index out of range")
+      return self._rows(np.array([key], dtype=np.int64))[0]
+    return self.expand()[key]
+
+  def __iter__(self):
+    n = len(self.base)
+    for start in range(0, self.count, n):
+      for note in self._rows(np.arange(start, min(start + n, self.count), dtype=np.int64)):
+        yield note
+
+  def __repr__(self):
+    return repr(self.toDicts())
+
+  def toDicts(self):
+    """
+      Returns the notes as a list of dicts
+    """
+    return self.expand().toDicts()
+
+  def shift(self, offset):
+    """
+      Returns a view of the loop with offset added to every start time
+    """
+    return LoopedNotes(self.base, self.period, self.end, self.offset + offset)
+
+  def withRegion(self, region):
+    """
+      Returns a view of the loop with every note tagged as the given region
+    """
+    return LoopedNotes(self.base.withRegion(region), self.period, self.end, self.offset)
+
+  def between(self, start = None, end = None):
+    """
+      Returns the notes starting in [start, end) as a NoteTable,
+      building only the repetitions which overlap that range
+    """
+    n = len(self.base)
+    if n == 0 or (start is not None and end is not None and start >= end):
+      return NoteTable()
+    lowIndex = 0
+    highIndex = self.count
+    if self.period > 0:
+      if start is not None:
+        last = int(self.base.time.max()) + self.offset
+        lowIndex = max(0, -((last - start) // self.period)) * n
+      if end is not None:
+        first = int(self.base.time.min()) + self.offset
+        highIndex = min(((end - 1 - first) // self.period + 1) * n, self.count)
+    if lowIndex >= highIndex:
+      return NoteTable()
+    return self._rows(np.arange(lowIndex, highIndex, dtype=np.int64)).between(start, end)
+
+  def countBetween(self, start = None, end = None):
+    """
+      Returns the number of notes starting in [start, end)
+    """
+    return len(self.between(start, end))
+
+class NoteStream(object):
+  """
+    A track's notes kept as the list of its (already shifted) region parts
+  """
+
+  def __init__(self, parts = ()):
+    self.parts = list(parts)
+    self.starts = []
+    count = 0
+    for p in self.parts:
+      self.starts.append(count)
+      count += len(p)
+    self.count = count
+    self._table = None
+
+  def __len__(self):
+    return self.count
+
+  def __getstate__(self):
+    # The expanded table is only a cache: don't pickle it
+    state = dict(self.__dict__)
+    state["_table"] = None
+    return state
+
+  def expand(self):
+    """
+      Returns every note of the stream as a NoteTable
+    """
+    if self._table is None:
+      self._table = NoteTable.concat([p.expand() for p in self.parts])
+    return self._table
+
+  time = _expandedColumn("time")
+  vel = _expandedColumn("vel")
+  pitch = _expandedColumn("pitch")
+  duration = _expandedColumn("duration")
+  region = _expandedColumn("region")
+
+  def __getitem__(self, key):
+    if isinstance(key, (int, np.integer)):
+      if key < 0:
+        key += self.count
+      if key < 0 or key >= self.count:
+        raise IndexError("note index out of range")
+      i = bisect.bisect_right(self.starts, key) - 1
+      return self.parts[i][key - self.starts[i]]
+    return self.expand()[key]
+
+  def __iter__(self):
+    return itertools.chain(*self.parts)
+
+  def __repr__(self):
+    return repr(self.toDicts())
+
+  def toDicts(self):
+    """
+      Returns the notes as a list of dicts
+    """
+    return self.expand().toDicts()
+
+  def shift(self, offset):
+    """
+      Returns a copy of the stream with offset added to every start time
+    """
+    return NoteStream([p.shift(offset) for p in self.parts])
+
+  def withRegion(self, region):
+    """
+      Returns a copy of the stream with every note tagged as the given region
+    """
+    return NoteStream([p.withRegion(region) for p in self.parts])
+
+  def between(self, start = None, end = None):
+    """
+      Returns the notes starting in [start, end) as a NoteTable,
+      only asking each part for that range
+    """
+    return NoteTable.concat([p.between(start, end) for p in self.parts])
+
+  def countBetween(self, start = None, end = None):
+    """
+      Returns the number of notes starting in [start, end)
+    """
+    return sum(p.countBetween(start, end) for p in self.parts)
@@ -0,0 +1,191 @@
+"""
+  On-disk cache of decoded GarageBand projects.
+
+  Entries are keyed by a hash of the project's ProjectData, MetaData.plist
+  and DisplayState.plist plus PARSER_VERSION, the Python major version
+  (names decode to byte strings on 2 and text on 3) and the instruments
+  pickle the tracks' keywords come from (see instrument.py), so a resubmitted
+  or regraded project is only parsed once. Bump PARSER_VERSION whenever a decoder changes
+  what it returns so stale entries are never read.
+
+  Each entry is a pickled dict of decoded fields (see bandFile.PROJECT_FIELDS).
+  The cache directory is kept under a size limit by evicting the least
+  recently used entries (hits refresh an entry's mtime). Each process keeps
+  an estimate of the directory's size (scanned once, then grown by its own
+  writes) and only scans and evicts when the estimate could pass the limit,
+  or when its writes since the last scan reach RESCAN_FRACTION of the limit
+  so other processes' writes are noticed. Entries which can't be read back
+  (e.x. pickled before a class was renamed) are deleted and count as misses.
+
+  Environment:
+    BAND_PROJECT_CACHE       -> cache directory (default ~/.cache/music-grading)
+    BAND_PROJECT_CACHE_SIZE  -> size limit in bytes, 0 disables the cache
+"""
+
+import os
+import sys
+import hashlib
+import pickle
+import tempfile
+
+import instrument
+
+PARSER_VERSION = 1
+PATH_TO_PROJECT = "Alternatives/000"
+KEY_FILES = ["ProjectData", "MetaData.plist", "DisplayState.plist"]
+ENTRY_SUFFIX = ".pickle"
+RESCAN_FRACTION = 0.125
+
+# Estimated size of the cache directory and bytes this process wrote since
+# it was last scanned, None before the first scan
+_total = None
+_written = 0
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "music-grading")
+DEFAULT_CACHE_SIZE = 512 * 1024 * 1024
+
+def getCacheDir():
+  """Returns the cache directory"""
+  return os.environ.get("BAND_PROJECT_CACHE", DEFAULT_CACHE_DIR)
+
+def getCacheSize():
+  """Returns the cache size limit in bytes"""
+  return int(os.environ.get("BAND_PROJECT_CACHE_SIZE", DEFAULT_CACHE_SIZE))
+
+def enabled():
+  """Returns true if the cache is turned on"""
+  return getCacheSize() > 0
+
+def projectKey(fp):
+  """
+    Returns the cache key of the project at the given path
+    Missing files hash as empty
+  """
+  h = hashlib.sha1("parser {} python {}\n".format(PARSER_VERSION, sys.version_info[0]).encode("ascii"))
+  files = [(name, os.path.join(fp, PATH_TO_PROJECT, name)) for name in KEY_FILES]
+  files.append(("instruments", instrument.getPicklePath()))
+  for name, path in files:
+    h.update((name + "\n").encode("ascii"))
+    try:
+      with open(path, "rb") as f:
+        data = f.read()
+    except IOError:
+      data = b""
+    h.update((str(len(data)) + "\n").encode("ascii"))
+    h.update(data)
+  return h.hexdigest()
+
+def getUmask():
+  """Returns the process's file mode creation mask"""
+  mask = os.umask(0)
+  os.umask(mask)
+  return mask
+
+def entryPath(key):
+  return os.path.join(getCacheDir(), key + ENTRY_SUFFIX)
+
+def get(key):
+  """
+    Returns the cached dict of decoded fields for key, or None on a miss
+  """
+  if not enabled():
+    return None
+  path = entryPath(key)
+  try:
+    with open(path, "rb") as f:
+      entry = pickle.load(f)
+  except (IOError, OSError):
+    return None
+  except Exception:
+    # Truncated, stale or foreign entry: drop it so the project is reparsed
+    remove(path)
+    return None
+  try:
+    os.utime(path, None)
+  except OSError:
+    pass
+  return entry
+
+def put(key, entry):
+  """
+    Stores the given dict of decoded fields under key and evicts old entries
+    if the cache could have grown past its size limit
+  """
+  global _total, _written
+  if not enabled():
+    return
+  cacheDir = getCacheDir()
+  path = entryPath(key)
+  try:
+    if not os.path.isdir(cacheDir):
+      os.makedirs(cacheDir)
+    # Write to a temporary file and rename so readers never see half an entry
+    fd, tmpPath = tempfile.mkstemp(dir=cacheDir, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+      pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+    # mkstemp creates the file readable by its owner only: give it the
+    # permissions of a normal new file so other graders sharing the cache can read it
+    os.chmod(tmpPath, 0o666 & ~getUmask())
+    size = os.path.getsize(tmpPath)
+    try:
+      replaced = os.path.getsize(path)
+    except OSError:
+      replaced = 0
+    os.rename(tmpPath, path)
+  except (IOError, OSError):
+    return
+  limit = getCacheSize()
+  if _total is None:
+    evict()
+    return
+  _total += size - replaced
+  _written += size
+  if _total > limit or _written >= limit * RESCAN_FRACTION:
+    evict()
+
+def remove(path):
+  try:
+    os.remove(path)
+  except OSError:
+    pass
+
+def evict():
+  """
+    Removes least recently used entries until the cache fits its size limit
+    and resets the size estimate to what is left
+  """
+  global _total, _written
+  cacheDir = getCacheDir()
+  entries = []
+  total = 0
+  for name in os.listdir(cacheDir):
+    if not name.endswith(ENTRY_SUFFIX):
+      continue
+    try:
+      st = os.stat(os.path.join(cacheDir, name))
+    except OSError:
+      continue
+    entries.append((st.st_mtime, st.st_size, name))
+    total += st.st_size
+  entries.sort()
+  limit = getCacheSize()
+  for mtime, size, name in entries:
+    if total <= limit:
+      break
+    remove(os.path.join(cacheDir, name))
+    total -= size
+  _total = total
+  _written = 0
+
+def clear():
+  """
+    Removes every entry from the cache
+  """
+  global _total
+  _total = None
+  cacheDir = getCacheDir()
+  if not os.path.isdir(cacheDir):
+    return
+  for name in os.listdir(cacheDir):
+    if name.endswith(ENTRY_SUFFIX):
+      remove(os.path.join(cacheDir, name))
@@ -0,0 +1,113 @@
+"""
+  Track x section matrix of a project's note tracks.
+
+  Sections are given as explicit boundaries, e.x. measure ranges.
+  One pass over each track's note times fills in, for every track x section:
+
+    counts      -> number of notes starting in [start, end)
+    atStart     -> number of those starting exactly on the section's start
+    firstOnset  -> start time of the first note in the section, -1 if none
+    lastOnset   -> start time of the last note in the section, -1 if none
+    coverage    -> ticks of the section covered by the track's regions
+
+  Rows follow the tracks' keys in order; only tracks with notes (instrument
+  tracks) get a row.
+
+  Dependencies:
+    numpy
+"""
+
+import numpy as np
+
+class SectionMatrix(object):
+  """
+    Per track, per section note statistics
+  """
+
+  def __init__(self, sections, tracks):
+    """
+      sections is a list of (label, start tick, end tick) in order and
+      not overlapping
+      tracks is a dict of tracks as returned by midiDump.makeTracks
+    """
+    self.labels = [s[0] for s in sections]
+    self.starts = np.array([s[1] for s in sections], dtype=np.int64)
+    self.ends = np.array([s[2] for s in sections], dtype=np.int64)
+    self.trackKeys = [k for k in sorted(tracks.keys()) if 'notes' in tracks[k]]
+    self.tracks = tracks
+    shape = (len(self.trackKeys), len(sections))
+    self.counts = np.zeros(shape, dtype=np.int64)
+    self.atStart = np.zeros(shape, dtype=np.int64)
+    self.firstOnset = np.full(shape, -1, dtype=np.int64)
+    self.lastOnset = np.full(shape, -1, dtype=np.int64)
+    self.coverage = np.zeros(shape, dtype=np.int64)
+    for row, key in enumerate(self.trackKeys):
+      self._fillRow(row, tracks[key])
+
+  @classmethod
+  def fromMeasures(cls, measures, tracks, ticksPerMeasure, labels = None):
+    """
+      Builds the matrix on sections given as (first measure, end measure)
+      counted from 0
+    """
+    if labels is None:
+      labels = [str(i) for i in range(len(measures))]
+    return cls([(label, m[0] * ticksPerMeasure, m[1] * ticksPerMeasure) \
+                for label, m in zip(labels, measures)], tracks)
+
+  def _fillRow(self, row, track):
+    nSections = len(self.labels)
+    if nSections == 0:
+      return
+    time = track['notes'].time
+    # Section of every note: the last one starting at or before it
+    section = np.searchsorted(self.starts, time, "right") - 1
+    inside = (section >= 0)
+    inside[inside] &= time[inside] < self.ends[section[inside]]
+    section = section[inside]
+    time = time[inside]
+    self.counts[row] = np.bincount(section, minlength=nSections)
+    self.atStart[row] = np.bincount(section[time == self.starts[section]], minlength=nSections)
+    first = np.full(nSections, np.iinfo(np.int64).max, dtype=np.int64)
+    last = np.full(nSections, -1, dtype=np.int64)
+    np.minimum.at(first, section, time)
+    np.maximum.at(last, section, time)
+    self.firstOnset[row] = np.where(self.counts[row] > 0, first, -1)
+    self.lastOnset[row] = last
+    # Overlap of every region with every section
+    regions = track.get('regions', [])
+    if regions:
+      rStart = np.array([r['start'] for r in regions], dtype=np.int64)
+      rEnd = rStart + np.array([r['length'] for r in regions], dtype=np.int64)
+      overlap = np.minimum(rEnd[:, None], self.ends[None, :]) \
+              - np.maximum(rStart[:, None], self.starts[None, :])
+      self.coverage[row] = np.maximum(overlap, 0).sum(axis=0)
+
+  def row(self, key):
+    """
+      Returns the row of the track with the given key
+    """
+    return self.trackKeys.index(key)
+
+  def column(self, label):
+    """
+      Returns the column of the first section with the given label
+    """
+    return self.labels.index(label)
+
+  def present(self, strict = False):
+    """
+      Returns a boolean track x section array, true where the track has notes
+      in the section. If strict, notes on the section's first tick don't count.
+    """
+    if strict:
+      return (self.counts - self.atStart) > 0
+    return self.counts > 0
+
+  def notes(self, key, label):
+    """
+      Returns the notes of the track with the given key starting in the
+      section with the given label
+    """
+    i = self.column(label)
+    return self.tracks[key]['notes'].between(int(self.starts[i]), int(self.ends[i]))
@@ -1,7 +1,7 @@
 import mmap
 import sys
 
-OCuA_TAG = "\x4f\x43\x75\x41\x01\x00\x0e\x00\x00\x00\x24\x00\x00\x00"
+OCuA_TAG = b"\x4f\x43\x75\x41\x01\x00\x0e\x00\x00\x00\x24\x00\x00\x00"
 
 def main():
   with open(sys.argv[1],'r+b') as f:
@@ -9,45 +9,28 @@ Doesn't work for some tracks and probably more research is needed. . .
 """
 
 import sys
+import re
 import mmap
-import struct
 
-GAIN_OFFSET = 0x37
+import channelStrips
 
-def getTrackGain( pd, instAddr ):
-  gainAddr = instAddr + GAIN_OFFSET
-  gain, = struct.unpack("I", pd[gainAddr:gainAddr+4])
-  return gain
-  
+INST_NAME = re.compile(r"^Inst (\d+)$")
+MAX_TRACKS = 255
 
 def getTrackList(pd):
+  strips = channelStrips.getStrips(pd)
   tracks = []
-  for i in range(1, 256):
-    # Get address of inst record
-    instAddr = pd.find("Inst " + str(i))
-    # Get gain byte
-    gain = getTrackGain(pd, instAddr)
-    # Get address of OCuA marker
-    ocuaAddr = pd.find(b"OCuA", instAddr)
-    # Check for UCuA markers between Inst and OCuA
-    p = pd.find(b"UCuA", instAddr, ocuaAddr)
-    if p != -1:
-      # Move to third UCuA marker
-      p = pd.find(b"UCuA", p + 4)
-      p = pd.find(b"UCuA", p + 4)
-      # Some times there might be empty instrument slots with one UCuA. . .
-      if p > ocuaAddr:
-        continue
-      # add offset of preset name from third UCuA marker
-      p += 0x34
-      # hack to strip anything after a dot from preset name:
-      # apple loops generate tracks with .pst
-      end = pd.find(b'.', p, p + 64)
-      if end == -1:
-        end = p + 64
-      # append preset name
-      tracks.append((i, pd[p:end].strip("\x00"), gain))
-  return tracks
+  for strip in strips.strips:
+    m = INST_NAME.match(strip.name)
+    # Only the first strip of each name counts
+    if not m or strips.get(strip.name) is not strip or int(m.group(1)) > MAX_TRACKS:
+      continue
+    # Some times there might be empty instrument slots with one UCuA. . .
+    preset = strip.preset()
+    if preset is None:
+      continue
+    tracks.append((int(m.group(1)), preset, strip.volume()))
+  return sorted(tracks)
 
   
 def main():
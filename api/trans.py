@@ -9,21 +9,26 @@ Note: Note data is already transposed when saved in regions.
 
 import sys
 import mmap
-import struct
 import pprint
 
-TRANS_CHUNK_TAG = "\x71\x53\x76\x45\x01\x00\x19"
+import chunkIndex
+import chunkSchema
+
+TRANS_CHUNK_TAG = chunkSchema.TRANSPOSITION.tag
+TRANS_POINT = chunkSchema.TRANS_POINT
 TIME_OFFSET = 0x9600
 VALUE_OFFSET = 0x3c00
 VALUE_SCALE = 256
+TRANS_RECORD_TYPE = 0x70
 
 def getTransChunk(pd):
   """
     Finds and returns the transposition chunk from given
     mmap'd ProjectData file
   """
-  transAddr = pd.find(TRANS_CHUNK_TAG)
-  (chunkSize,) = struct.unpack("<Q", pd[transAddr+28:transAddr+36])
+  pd = chunkIndex.getIndex(pd)
+  transAddr = pd.findChunk(TRANS_CHUNK_TAG)
+  (chunkSize,) = pd.unpack("<Q", transAddr+28)
   return pd[transAddr+36:transAddr+36+chunkSize]
 
 def decodeTransChunk(t):
@@ -31,15 +36,13 @@ def decodeTransChunk(t):
     Split the given transposition chunk into records,
     pull out points, return as array of dicts: {time: , value}
   """
-  offset = 0
+  count = TRANS_POINT.countWhile(t, "type", lambda kind: kind == TRANS_RECORD_TYPE)
   points = []
-  while t[offset] == "\x70":
-    time, value = struct.unpack("<4xL13xH", t[offset:offset+0x17])
+  for kind, time, value in TRANS_POINT.unpackAll(t, 0, count):
     time -= TIME_OFFSET
     value -= VALUE_OFFSET
-    value /= VALUE_SCALE
+    value //= VALUE_SCALE
     points.append({"time":time, "value":value})
-    offset += 0x30
   return points
 
 def main():
@@ -1,34 +1,108 @@
 """
   Reads all files referenced by the given glob and tries to add them to the database
   Paths which include spaces must be in quotes.
+
+  Meta data is parsed in a pool of worker processes and written in large
+  transactions. Files whose size and mtime match what was recorded the last
+  time they were added are skipped, so rerunning on a library only reads new
+  or changed loops (use --full to read everything again).
 """
 
-import sys
 import glob
 import os
+import argparse
+import multiprocessing
 import appleLoops
-import cafLib 
+import cafLib
+
+# Number of loops written per transaction
+BATCH_SIZE = 1000
+
+def fileStat(path):
+  """
+    Returns (size, mtime) of the file at path
+  """
+  st = os.stat(path)
+  return (st.st_size, st.st_mtime)
+
+def readLoop(path):
+  """
+    Worker: loads the meta data of the loop at path
+    Returns (path, data) with data None if it could not be loaded
+  """
+  try:
+    data = cafLib.loadMetaData(path)
+  except:
+    return (path, None)
+  data['filename'] = unicode(os.path.basename(path), "utf-8")
+  return (path, data)
+
+def changedPaths(paths, recorded):
+  """
+    Returns the paths whose (size, mtime) differ from the recorded ones
+    along with a dict of their current stats by filename
+  """
+  changed = []
+  stats = {}
+  for path in paths:
+    name = unicode(os.path.basename(path), "utf-8")
+    try:
+      stat = fileStat(path)
+    except OSError:
+      continue
+    if recorded.get(name) != stat:
+      changed.append(path)
+      stats[name] = stat
+  return changed, stats
+
+def writeBatch(db, batch, stats):
+  """
+    Writes a batch of meta data dicts in one transaction
+    Returns the number of loops added
+  """
+  if not batch:
+    return 0
+  batchStats = dict((d['filename'], stats[d['filename']]) for d in batch \
+                    if d['filename'] in stats)
+  if db.addFilenames(batch, batchStats) == 0:
+    return len(batch)
+  for data in batch:
+    print("Failed to add meta data loaded from: {}".format(data.get('filename')))
+  return 0
 
 def main():
-  if len(sys.argv) != 2:
-    print("Usage: python addBlobToDB.py path/to/some/files/*.caf")
-    return
+  parser = argparse.ArgumentParser(description="Add apple loops to the database.")
+  parser.add_argument('glob', help="Glob of .caf files, e.x. \"path/to/some/files/*.caf\"")
+  parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(), \
+                      help="Number of worker processes (default: one per core)")
+  parser.add_argument('--full', action='store_true', \
+                      help="Read every file, even if it is unchanged since it was added")
+  args = parser.parse_args()
   db = appleLoops.Database()
+  print("Looking through {}".format(args.glob))
+  paths = glob.glob(args.glob)
+  recorded = {} if args.full else db.getFileStats()
+  paths, stats = changedPaths(paths, recorded)
+  print("{} new or changed files".format(len(paths)))
+  if not paths:
+    return
   count = 0
-  print("Looking through {}".format(sys.argv[1]))
-  for path in glob.glob(sys.argv[1]):
-    try:
-      data = cafLib.loadMetaData(path)
-    except:
-      print("Failed to load meta data from: {}".format(path))
-      continue
-    data['filename'] = unicode(os.path.basename(path), "utf-8")
-    if db.addFilename(data) == 0:
-      count += 1
-    else:
-      print("Failed to add meta data loaded from: {}".format(path))
+  batch = []
+  pool = multiprocessing.Pool(max(1, args.jobs))
+  try:
+    for path, data in pool.imap_unordered(readLoop, paths, chunksize=64):
+      if data is None:
+        print("Failed to load meta data from: {}".format(path))
+        continue
+      batch.append(data)
+      if len(batch) >= BATCH_SIZE:
+        count += writeBatch(db, batch, stats)
+        batch = []
+    count += writeBatch(db, batch, stats)
+  finally:
+    pool.close()
+    pool.join()
   print("Added {} loops to database".format(count))
-    
 
 if __name__ == "__main__":
   main()
@@ -17,6 +17,20 @@ Database Schema:
     beat_count      | text
     key_signature   | text
     key_type        | text
+
+  Index: audioLoopsFilename on audioLoops(filename)
+
+  Table: loopFiles (size and mtime of every ingested file, for rescans)
+
+    Column Name     | type
+    ----------------+--------
+    filename        | text primary key
+    size            | integer
+    mtime           | real
+
+Lookups from grading go through one shared read-only connection per
+process (see getDatabase) and resolve all of a project's loops in one query
+(see getLoopsMetadata).
   
 Possible Edge cases: Drummer loops?
 
@@ -26,6 +40,15 @@ Chris Misa, chris@chrismisa.com
 
 import sqlite3
 import os
+import sys
+import collections
+
+# Largest number of names bound in one "in (...)" query,
+# sqlite's default limit on host parameters is 999
+MAX_QUERY_NAMES = 900
+
+# Process wide read-only Database, as (pid, Database)
+_shared = None
 
 class Database:
   """
@@ -39,17 +62,27 @@ class Database:
           "genre":"text", "descriptors":"text", "time_signature":"text", \
           "beat_count":"text", "key_signature":"text", "key_type":"text"}
 
-  def __init__(self, filepath = DB_NAME):
+  def __init__(self, filepath = DB_NAME, readOnly = False):
     """
       Instantiates a new database access object connected to the
       sqlite database at the given filepath.
+      A readOnly connection opens the file read only and never writes,
+      not even the schema: it expects a database built by a writable one.
     """
+    self.conn = None
+    if readOnly:
+      self.conn = connectReadOnly(filepath)
+      return
     self.conn = sqlite3.connect(filepath)
-    # make sure there is the right table
+    # make sure there is the right table and index
     cur = self.conn.cursor()
     schema = ",".join(k + " " + v for k, v in self.COLUMNS.items())
     cur.execute("create table if not exists \
                  audioLoops(" + schema + ");")
+    cur.execute("create index if not exists \
+                 audioLoopsFilename on audioLoops(filename);")
+    cur.execute("create table if not exists \
+                 loopFiles(filename text primary key, size integer, mtime real);")
     self.conn.commit()
 
   def __del__(self):
@@ -70,33 +103,77 @@ class Database:
     for d in data:
       result.append(dict(zip(self.COLUMNS.keys(), d)))
     return result
+
+  def getDataForLoops(self, loopFileNames):
+    """
+      Looks up all of the given file names at once and returns a dict from
+      each file name to the list of metadata dicts found for it
+    """
+    names = list(set(loopFileNames))
+    result = dict((name, []) for name in names)
+    cols = ",".join(self.COLUMNS.keys())
+    filenameIndex = list(self.COLUMNS.keys()).index("filename")
+    cur = self.conn.cursor()
+    for i in range(0, len(names), MAX_QUERY_NAMES):
+      batch = names[i:i+MAX_QUERY_NAMES]
+      tags = ",".join("?" for name in batch)
+      data = cur.execute("select {} from audioloops where filename in ({});".format(cols, tags), \
+                         batch).fetchall()
+      for d in data:
+        result[d[filenameIndex]].append(dict(zip(self.COLUMNS.keys(), d)))
+    return result
       
   def addFilename(self, data):
     """
       Writes the given data to the database assuming data is a dict with
       keys as described in Database Schema above.
+      Replaces any data already stored for the same filename.
       Returns -1 if data is not a valid entry.
     """
-    # make sure there is at least a filename in the given data
-    if "filename" not in data.keys():
-      return -1
-    # make sure there are no bad keys in given data
-    for k in data.keys():
-      if k not in self.COLUMNS.keys():
-        print("Ignoring key: {} in {}".format(k, data['filename']))
-    newdata = {k:v for k,v in data.items() if k in self.COLUMNS.keys()}
-    data = newdata
+    return self.addFilenames([data])
+
+  def addFilenames(self, dataList, fileStats = None):
+    """
+      Writes each of the given data dicts (see addFilename) in one transaction,
+      replacing the data already stored for the same filenames. If a filename
+      appears more than once in dataList the last data for it wins.
+      fileStats optionally maps filenames to (size, mtime) to record for rescans.
+      Returns -1 if any data is not a valid entry, in which case nothing is written.
+    """
+    rows = collections.OrderedDict()
+    for data in dataList:
+      # make sure there is at least a filename in the given data
+      if "filename" not in data.keys():
+        return -1
+      # make sure there are no bad keys in given data
+      for k in data.keys():
+        if k not in self.COLUMNS.keys():
+          print("Ignoring key: {} in {}".format(k, data['filename']))
+      rows[data['filename']] = dict((k, data.get(k)) for k in self.COLUMNS.keys())
+    rows = list(rows.values())
 
     # form string for the querry
-    cols = "(" + ",".join(data.keys()) + ")"
-    tags = "(" + ",".join(":" + k for k in data.keys()) + ")"
-    # execute querry
-    cur = self.conn.cursor()
-    cur.execute("insert into audioLoops {} values {};".format(cols, tags), \
-                data)
-    self.conn.commit()
+    cols = "(" + ",".join(self.COLUMNS.keys()) + ")"
+    tags = "(" + ",".join(":" + k for k in self.COLUMNS.keys()) + ")"
+    # execute querries, "with" commits once at the end or rolls back
+    with self.conn:
+      cur = self.conn.cursor()
+      cur.executemany("delete from audioLoops where filename = ?;", \
+                      [(row['filename'],) for row in rows])
+      cur.executemany("insert into audioLoops {} values {};".format(cols, tags), rows)
+      if fileStats:
+        cur.executemany("insert or replace into loopFiles values (?, ?, ?);", \
+                        [(name, size, mtime) for name, (size, mtime) in fileStats.items()])
     return 0
 
+  def getFileStats(self):
+    """
+      Returns a dict from each ingested filename to its recorded (size, mtime)
+    """
+    cur = self.conn.cursor()
+    return dict((name, (size, mtime)) for name, size, mtime in \
+                cur.execute("select filename, size, mtime from loopFiles;"))
+
   def listFilenames(self):
     """
       Returns a list of all filenames (primary keys) currently stored in the database
@@ -110,12 +187,44 @@ class Database:
     """
     cur = self.conn.cursor()
     cur.execute("delete from audioloops where filename = ?;",(filename,))
+    cur.execute("delete from loopFiles where filename = ?;",(filename,))
     self.conn.commit()
 
 
+def connectReadOnly(filepath):
+  """
+    Opens the sqlite database at filepath without write access:
+    as a read only URI where sqlite3 supports them (py3), otherwise
+    with every write refused by the query_only pragma
+  """
+  if sys.version_info[0] >= 3:
+    from urllib.request import pathname2url
+    return sqlite3.connect("file:{}?mode=ro".format(pathname2url(os.path.abspath(filepath))), \
+                           uri = True)
+  conn = sqlite3.connect(filepath)
+  conn.execute("pragma query_only = on;")
+  return conn
+
+def getDatabase():
+  """
+    Returns this process's shared read-only connection to the default
+    database, opening it on first use
+  """
+  global _shared
+  # Connections must not be shared across fork()
+  if _shared is None or _shared[0] != os.getpid():
+    _shared = (os.getpid(), Database(readOnly = True))
+  return _shared[1]
+
 def getLoopMetadata(loopName):
   """
     Returns metadata for the given loop if it is found in database,
     otherwise None
   """
-  return Database().getDataForLoop(loopName)
+  return getDatabase().getDataForLoop(loopName)
+
+def getLoopsMetadata(loopNames):
+  """
+    Returns a dict from each of the given loop names to its metadata
+  """
+  return getDatabase().getDataForLoops(loopNames)
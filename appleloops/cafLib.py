@@ -7,24 +7,37 @@ Chris Misa, chris@chrismisa.com
 """
 
 import sys
-import mmap
 import struct
 
+CAF_FILE_HEADER_SIZE = 8
+CAF_CHUNK_HEADER_SIZE = 12
+UUID_SIZE = 16
 APPLE_LOOP_METADATA_UUID = "\x29\x81\x92\x73\xb5\xbf\x4a\xef\xb7\x8d\x62\xd1\xef\x90\xbb\x2c"
 
 def getMetaDataChunk(filepath):
   """
-    Opens the given file, finds the uuid chunk with meta data uuid,
-    dumps the data section minus headers and uuid as string
+    Opens the given file, walks its chunk headers to the uuid chunk with
+    meta data uuid and dumps the data section minus headers and uuid as string.
+    Other chunks (e.x. the audio data) are seeked past without being read.
+    Raises ValueError if the file has no meta data chunk.
   """
   with open(filepath, "rb") as f:
-    cafData = mmap.mmap(f.fileno(), 0, mmap.MAP_PRIVATE)
-    addr = 0
+    f.seek(CAF_FILE_HEADER_SIZE)
     while True:
-      addr = cafData.find(b"uuid")
-      dataLength, dataUUID = struct.unpack(">Q16s", cafData[addr + 4 : addr + 28])
-      if dataUUID == APPLE_LOOP_METADATA_UUID:
-        return cafData[addr+28:addr+dataLength+12]
+      header = f.read(CAF_CHUNK_HEADER_SIZE)
+      if len(header) < CAF_CHUNK_HEADER_SIZE:
+        break
+      chunkType, dataLength = struct.unpack(">4sq", header)
+      if chunkType == b"uuid" and dataLength >= UUID_SIZE:
+        if f.read(UUID_SIZE) == APPLE_LOOP_METADATA_UUID:
+          return f.read(dataLength - UUID_SIZE)
+        f.seek(dataLength - UUID_SIZE, 1)
+      elif dataLength < 0:
+        # Only the audio data chunk may have unknown size, it runs to the end
+        break
+      else:
+        f.seek(dataLength, 1)
+  raise ValueError("No apple loop meta data in {}".format(filepath))
 
 def decodeMetaData(md):
   """
@@ -0,0 +1,97 @@
+"""
+  Grades a directory of GarageBand submissions against one assignment.
+
+  Usage: python batchGrade.py path/to/submissions assignment# [-j jobs]
+
+  Submissions are picked up by the naming convention in README.md:
+
+    Last_First_MI_assignment#.band
+
+  Projects are graded in a pool of worker processes (one per core by default)
+  and each student's results are printed as soon as they are finished,
+  one line per chapter:
+
+    student <tab> chapter <tab> Pass|Fail|Error <tab> details
+"""
+
+import sys
+import os
+import re
+import argparse
+import multiprocessing
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+for d in ["chapters", "api", "appleloops"]:
+  sys.path.append(os.path.join(ROOT, d))
+
+import grading
+from errors import TestError
+
+SUBMISSION_PATTERN = re.compile( \
+    r"^(?P<student>[^_]+_[^_]+(?:_[^_]*)?)_(?:assignment)?(?P<assignment>\d+)\.band$", \
+    re.IGNORECASE)
+
+def findSubmissions(directory, assignment):
+  """
+    Returns a sorted list of (student, path) for the .band projects in
+    directory submitted for the given assignment
+  """
+  submissions = []
+  for name in os.listdir(directory):
+    m = SUBMISSION_PATTERN.match(name)
+    if m and int(m.group("assignment")) == assignment:
+      submissions.append((m.group("student"), os.path.join(directory, name)))
+  return sorted(submissions)
+
+def summarize(result):
+  """
+    Converts a chapter result into a (status, details) pair of strings
+  """
+  if result is True:
+    return ("Pass", "")
+  if isinstance(result, TestError):
+    return ("Fail", "; ".join("{}.{} {}".format(c.ch, c.req, c.description) \
+                              for c in result.testCodeList))
+  if isinstance(result, Exception):
+    return ("Error", "{}: {}".format(type(result).__name__, result))
+  return ("Fail", str(result))
+
+def gradeSubmission(job):
+  """
+    Worker: grades one submission
+    Returns (student, list of (chapter, status, details))
+  """
+  student, path, assignment = job
+  try:
+    results = grading.GradingSession(path).grade(assignment)
+  except Exception as error:
+    return (student, [(ch, "Error", "{}: {}".format(type(error).__name__, error)) \
+                      for ch in grading.ASSIGNMENT_CHAPTERS[assignment]])
+  return (student, [(ch,) + summarize(results[ch]) for ch in sorted(results)])
+
+def main():
+  parser = argparse.ArgumentParser(description="Grade a directory of GarageBand submissions.")
+  parser.add_argument('directory', help="Directory of Last_First_MI_assignment#.band projects")
+  parser.add_argument('assignment', type=int, help="Assignment number (see README.md)")
+  parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(), \
+                      help="Number of worker processes (default: one per core)")
+  args = parser.parse_args()
+  if args.assignment not in grading.ASSIGNMENT_CHAPTERS:
+    parser.error("unknown assignment {}".format(args.assignment))
+  jobs = [(student, path, args.assignment) for student, path in \
+          findSubmissions(args.directory, args.assignment)]
+  if not jobs:
+    print("No submissions for assignment {} in {}".format(args.assignment, args.directory))
+    return
+  pool = multiprocessing.Pool(max(1, min(args.jobs, len(jobs))))
+  try:
+    for student, results in pool.imap_unordered(gradeSubmission, jobs):
+      for ch, status, details in results:
+        print("\t".join([student, "ch" + str(ch), status, details]))
+      sys.stdout.flush()
+  finally:
+    pool.close()
+    pool.join()
+
+if __name__ == "__main__":
+  main()
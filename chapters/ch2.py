@@ -1,7 +1,7 @@
 import sys
 sys.path.append("../api")
-import bandFile
 from errors import TestError, TestCode
+import grading
 
 """
   Test garageband files against chapter 2 rubric
@@ -26,13 +26,14 @@ def hasGoodKey(bf):
   KEYS = [('C', 'major'),('G','major'),('A','minor')]
   return (bf['key'], bf['gender']) in KEYS
 
+@grading.sessionTest
 def test(fp):
   """
     Runs chapter 2 tests against the given garageband project
   """
 
   failedCodes = []
-  bf = bandFile.load(fp)
+  bf = grading.getSession(fp)
   if not hasAnInstrument(bf):
     failedCodes.append(TestCode(2,1,description = "no software instrument found"))
 
@@ -1,7 +1,7 @@
 import sys
 sys.path.append("../api")
-import bandFile
 from errors import TestError, TestCode
+import grading
 
 ticksPerMeasure = 3840
 
@@ -34,12 +34,13 @@ def hasDrummerTrack(bf):
             return False
     return False
 
+@grading.sessionTest
 def test(fp):
     """
         Runs chapter 3 tests against the given garageband project
     """
     failedCodes = []
-    bf = bandFile.load(fp)
+    bf = grading.getSession(fp)
     if not hasVerseChorusInArrangment(bf):
         failedCodes.append(TestCode(3,1,description = "Verse/Chorus with 8 measures is not in Arrangment"))
 
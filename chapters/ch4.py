@@ -5,13 +5,16 @@
 import sys
 sys.path.append("../api")
 sys.path.append("../appleloops")
-import bandFile
 import appleLoops
 from errors import TestError, TestCode
+import grading
 from utilities import grab_section, are_equal
 import pprint
+import numpy as np
 
 TICKS_PER_MEASURE = 4 * 960
+# Pitch classes of the black keys
+BLACK_KEYS = [1, 3, 6, 8, 10]
 
 def hasCorrectInstruments(bf):
   """
@@ -100,9 +103,9 @@ def trackFiveHasCorrectLoop(bf):
     if 'regions' not in track.keys():
       return False
     # Else check that each region qualifies
+    metadata = appleLoops.getLoopsMetadata([r['name'] for r in track['regions']])
     for r in track['regions']:
-      metadata = appleLoops.getLoopMetadata(r['name'])
-      for md in metadata:
+      for md in metadata[r['name']]:
         if "Percussion" not in md['category']:
           return False
     return True
@@ -119,9 +122,9 @@ def diffVerseChorus(tracks):
   for track in tracks:
     if 'notes' not in track.keys():
       continue
-    verseNotes = [note for note in track['notes'] if note['time'] < 8*TICKS_PER_MEASURE]
-    chorusNotes = [note for note in track['notes'] if note['time'] >= 8*TICKS_PER_MEASURE \
-      and note['time'] < 16*TICKS_PER_MEASURE]
+    notes = track['notes']
+    verseNotes = notes.between(end = 8*TICKS_PER_MEASURE)
+    chorusNotes = notes.between(8*TICKS_PER_MEASURE, 16*TICKS_PER_MEASURE)
     if are_equal(verseNotes,chorusNotes):
       return False
   return True
@@ -145,19 +148,18 @@ def check_white_keys(tracks):
   """
   for track in tracks:
     if "notes" in track.keys():
-      for note in track['notes']:
-        p = note["pitch"] % 12
-        if p == 1 or p == 3 or p == 6 or p == 8 or p == 10:
-          return False
+      if np.any(np.in1d(track['notes'].pitch % 12, BLACK_KEYS)):
+        return False
   return True
   
 
+@grading.sessionTest
 def test(fp):
   """
     Runs chapter 4 tests against the given gb project
   """
   failedCodes = []
-  bf = bandFile.load(fp)
+  bf = grading.getSession(fp)
   if not hasCorrectInstruments(bf):
     failedCodes.append(TestCode(4,1,description="Wrong track layout"))
 
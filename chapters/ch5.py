@@ -2,10 +2,14 @@ import sys
 sys.path.append("../api")
 
 import midiDump as md
-import utilities as ut
+from fingerprint import FingerprintIndex
 from errors import TestError, TestCode
+import grading
 from copy import deepcopy
-import bandFile as bf
+import numpy as np
+
+# Pitch classes of the black keys
+BLACK_KEYS = [1, 3, 6, 8, 10]
 
 def check_2_4_bar_regions(seq, tpqn = 480):
 
@@ -24,20 +28,16 @@ def check_verse_chorus(seq, verse_measures, tpqn = 480):
 	melody = seq[1]["notes"]
 
 	index = 0
-	for note in melody:
-		time = note["time"]
-		if time >= verse_measures*4*tpqn:
-			index = melody.index(note)
-			break
+	later = np.flatnonzero(melody.time >= verse_measures*4*tpqn)
+	if len(later):
+		index = later[0]
 
 	verse = melody[0:index]
 	chorus = melody[index:]
 
 	def are_equal(seg1, seg2):
 		if len(seg1) == len(seg2):
-			for i in range(len(seg1)):
-				if seg1[i]["pitch"] != seg2[i]["pitch"]:
-					return False
+			return bool(np.all(seg1.pitch == seg2.pitch))
 		return True
 	return are_equal(verse, chorus)
 
@@ -50,12 +50,12 @@ def quantize_rhythm(seq, quantum = 120):
 
 		if "notes" in seq_copy[i]:
 
-			track = seq_copy[i]["notes"]
+			track = seq_copy[i]["notes"].expand()
 
-			for note in track:
+			track.duration = track.duration // quantum * quantum
+			track.time = track.time // quantum * quantum
 
-				note["duration"] = note["duration"] / quantum * quantum
-				note["time"] = note["time"] / quantum * quantum
+			seq_copy[i]["notes"] = track
 
 	return seq_copy
 
@@ -65,18 +65,12 @@ def is_quantized(seq, quantum = 120):
 
 	for i in seq.keys():
 
-		track_is_quantized = True
-
-		if "notes" in seq[i] and track_is_quantized:
+		if "notes" in seq[i]:
 
 			track = seq[i]["notes"]
 
-			for note in track:
-
-				if note["duration"] != note["duration"] / quantum * quantum or note["time"] != note["time"] / quantum * quantum:
-					quantized = False
-					track_is_quantized = False
-					break			
+			if np.any(track.duration % quantum) or np.any(track.time % quantum):
+				quantized = False
 					
 	return quantized
 
@@ -90,13 +84,8 @@ def check_white_keys(seq):
 
 			track = seq[i]["notes"]
 
-			for note in track:
-
-				p = note["pitch"] % 12
-
-				if p == 1 or p == 3 or p == 6 or p == 8 or p == 10:
-					all_white = False
-					break
+			if np.any(np.in1d(track.pitch % 12, BLACK_KEYS)):
+				all_white = False
 
 	return all_white
 
@@ -107,11 +96,8 @@ def in_range(seq):
 
 	melody = seq[1]["notes"]
 
-	for note in melody:
-
-		if note["pitch"] > 77 or note["pitch"] < 48:
-			all_in_range = False
-			break
+	if np.any((melody.pitch > 77) | (melody.pitch < 48)):
+		all_in_range = False
 
 	return all_in_range
 
@@ -121,37 +107,27 @@ def check_one_note(seq):
 
 	melody = seq[1]["notes"]
 
-	for j in range(len(melody) - 1):
+	current_end = melody.time[:-1] + melody.duration[:-1]
+	next_start = melody.time[1:]
 
-		current_end = melody[j]["time"] + melody[j]["duration"]
-		next_start = melody[j+1]["time"]
+	if np.any(next_start < current_end):
 
-		if next_start < current_end:
+		one_note = False
 
-			one_note = False
-			break
 	return one_note
 
 
 def check_for_motifs(seq):
 
-	repetition = False
-
-	melody_regions = seq[1]["regions"]
-
-	length = len(melody_regions)
-
-	for i in range(length):
-		for j in range(i+1, length):
-
-			if ut.are_equal(melody_regions[i], melody_regions[j]):
+	melody_regions = [region["notes"] for region in seq[1]["regions"]]
 
-				repetition = True
-				return repetition
+	return FingerprintIndex(melody_regions).hasRepetition()
 
+@grading.sessionTest
 def test(fp):
 
-	tracks = md.makeTracks(fp)
+	project = grading.getSession(fp)
+	tracks = project['tracks']
 
 	failedCodes = []
 
@@ -162,7 +138,7 @@ def test(fp):
 		failedCodes.append(TestCode(5,2,description = "no repetition or motifs"))
 
 	### What is verse chorus structure at this point?
-	verse_measures = bf.load(fp)['arrangement'][0][1]
+	verse_measures = project['arrangement'][0][1]
 	if check_verse_chorus(tracks, 8, tpqn = 960):
 		failedCodes.append(TestCode(5,4,description = "verse and melody are the same"))
 
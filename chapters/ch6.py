@@ -4,7 +4,7 @@ sys.path.append("../api")
 import midiDump as md
 import utilities as ut
 from errors import TestError, TestCode
-import bandFile as bf
+import grading
 
 # requirement 6.1
 def check_form(info, tpqn = 480):
@@ -61,8 +61,9 @@ def same_content(info, tpqn = 480):
 
 	return True
 
+@grading.sessionTest
 def test(fp):
-	info = bf.load(fp)
+	info = grading.getSession(fp)
 
 	failedCodes = []
 
@@ -1,7 +1,7 @@
 import sys
 sys.path.append("../api")
-import bandFile
 from errors import TestError, TestCode
+import grading
 
 # Array of where transposition points are allowed to happend (in measures)
 TARGET_TRANS_POINTS = [20,28,36,44,52]
@@ -31,13 +31,14 @@ def testTranspositionTrack(trans):
   else:
     return 0
 
+@grading.sessionTest
 def test(fp):
   """
     Runs chapter 7 tests against the given garageband project
   """
   
   failedCodes = []
-  bf = bandFile.load(fp)
+  bf = grading.getSession(fp)
 
   result = testTranspositionTrack(bf['transposition'])
   if result == 1:
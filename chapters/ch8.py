@@ -6,35 +6,24 @@
 
 import sys
 sys.path.append("../api")
-import bandFile
 from errors import TestError, TestCode
+import grading
+from sectionMatrix import SectionMatrix
 from pprint import pprint
 
 TICKS_PER_MEASURE = 4 * 960
 
 # Array of tuples with expected section boundaries
 SECTIONS_MEASURES = [(0,4),(4,12),(12,20),(20,28),(28,36),(36,44),(44,52),(52,60),(60,68)]
-SECTIONS_TICKS = [(sec[0]*TICKS_PER_MEASURE,sec[1]*TICKS_PER_MEASURE) \
-                  for sec in SECTIONS_MEASURES]
-
-def isPresent(notes, section):
-  """
-    Returns true if the given notes array contains notes in the given section
-    boundary.
-  """
-  if len([note for note in notes if note['time'] > section[0] \
-                                  and note['time'] < section[1]]) > 0:
-    return True
-  else:
-    return False
 
 def getSectionalForm(tracks):
   """
     Returns a 2-dimensional array with boolean values for each track X section
     If the tracks and section are correct this will be a 5 by 9 array
   """
-  return [[isPresent(track['notes'],section) for section in SECTIONS_TICKS] \
-           for key, track in tracks.items() if 'notes' in track.keys()]
+  sections = SectionMatrix.fromMeasures(SECTIONS_MEASURES, tracks, TICKS_PER_MEASURE)
+  # A note on a section's first tick doesn't make its track present
+  return sections.present(strict = True).tolist()
 
 def testSectionalForm(form):
   """
@@ -72,13 +61,14 @@ def testSectionalForm(form):
   # If we get to here everything passed to return true
   return True
 
+@grading.sessionTest
 def test(fp):
   """
     Runs chapter 8 tests against the given garageband project
   """
   
   failedCodes = []
-  bf = bandFile.load(fp)
+  bf = grading.getSession(fp)
   result = testSectionalForm(getSectionalForm(bf['tracks']))
   if result != True:
     failedCodes.append(TestCode(8,1,description = result))
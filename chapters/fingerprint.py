@@ -0,0 +1,99 @@
+"""
+  Region fingerprints for finding repeated material (motifs, repeated
+  sections) without comparing every pair of regions.
+
+  A Fingerprint is computed once per region from its notes:
+
+    pitches    -> MIDI pitches in order
+    durations  -> durations counted in quanta, as utilities.are_equal does
+
+  A FingerprintIndex hashes every pitch sequence left after deleting up to
+  maxPitchDist notes into buckets, so two regions within that edit distance
+  always share a bucket. Only pairs sharing a bucket are checked with the
+  bounded edit distance from utilities.
+
+  hasRepetition() gives the same answer as calling utilities.are_equal on
+  every pair of regions, but only the candidates are compared.
+"""
+
+import itertools
+
+import utilities as ut
+
+class Fingerprint(object):
+  """
+    Quantized signatures of one region's notes
+  """
+
+  def __init__(self, notes, quantum = 120):
+    self.pitches = tuple(notes.pitch.tolist())
+    self.durations = tuple((notes.duration // quantum).tolist())
+
+  def nearKeys(self, maxDist):
+    """
+      Returns the set of pitch sequences left after deleting up to
+      maxDist notes
+    """
+    keys = set([self.pitches])
+    frontier = keys
+    for _ in range(maxDist):
+      frontier = set(seq[:i] + seq[i+1:] for seq in frontier for i in range(len(seq)))
+      keys |= frontier
+    return keys
+
+class FingerprintIndex(object):
+  """
+    Fingerprints of a list of regions bucketed for repetition lookups.
+    The defaults match utilities.are_equal: pitch distance < 2 and
+    quantized duration distance < 5.
+  """
+
+  def __init__(self, regions = (), maxPitchDist = 1, maxDurDist = 4, quantum = 120):
+    self.maxPitchDist = maxPitchDist
+    self.maxDurDist = maxDurDist
+    self.quantum = quantum
+    self.fingerprints = []
+    self.near = {}
+    for notes in regions:
+      self.add(notes)
+
+  def __len__(self):
+    return len(self.fingerprints)
+
+  def add(self, notes):
+    """
+      Fingerprints a region's notes and returns its index
+    """
+    i = len(self.fingerprints)
+    fp = Fingerprint(notes, self.quantum)
+    self.fingerprints.append(fp)
+    for key in fp.nearKeys(self.maxPitchDist):
+      self.near.setdefault(key, []).append(i)
+    return i
+
+  def candidates(self):
+    """
+      Returns the sorted pairs (i, j), i < j, of regions sharing a near bucket
+    """
+    pairs = set()
+    for bucket in self.near.values():
+      pairs.update(itertools.combinations(bucket, 2))
+    return sorted(pairs)
+
+  def similar(self, i, j):
+    """
+      Returns true if regions i and j are within the index's distances
+    """
+    a = self.fingerprints[i]
+    b = self.fingerprints[j]
+    return ut.editDistBits(a.pitches, b.pitches, self.maxPitchDist) <= self.maxPitchDist \
+       and ut.editDistBits(a.durations, b.durations, self.maxDurDist) <= self.maxDurDist
+
+  def hasRepetition(self):
+    """
+      Returns true if any two regions repeat each other
+    """
+    for i, j in self.candidates():
+      if self.similar(i, j):
+        return True
+    return False
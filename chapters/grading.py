@@ -0,0 +1,122 @@
+"""
+  Grading sessions: parse a garageband project once and run every chapter
+  test mapped to an assignment against it.
+
+  Every chapter's test() accepts either a file path or a GradingSession
+  (see sessionTest), so a project is only decoded once per submission no
+  matter how many chapters read it.
+"""
+
+import sys
+sys.path.append("../api")
+import importlib
+import functools
+import pkgutil
+import bandFile
+from errors import TestError, TestCode
+
+# Assignment <==> Chapter Mapping (see README.md)
+ASSIGNMENT_CHAPTERS = {1:[2,3], 2:[4], 3:[5], 4:[6], 5:[7,8], 6:[12,13]}
+
+class GradingSession(object):
+  """
+    Handle on one submission: indexed like the dict from bandFile.load
+    with each value decoded on first use and shared by every chapter test.
+  """
+
+  def __init__(self, filepath):
+    self.filepath = filepath
+    self.project = bandFile.load(filepath, lazy = True)
+    if self.project is None:
+      raise IOError("Failed to load project at {}".format(filepath))
+
+  def __getitem__(self, key):
+    return self.project[key]
+
+  def __contains__(self, key):
+    return key in self.project
+
+  def keys(self):
+    return self.project.keys()
+
+  def items(self):
+    return self.project.items()
+
+  def close(self):
+    """
+      Writes everything decoded so far to the project cache
+    """
+    self.project.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+  def grade(self, assignment):
+    """
+      Runs the chapter tests mapped to the given assignment
+      Returns a dict from chapter number to True, the TestError raised
+      or the exception a crashing chapter raised
+    """
+    results = {}
+    try:
+      for ch in ASSIGNMENT_CHAPTERS[assignment]:
+        results[ch] = runChapter(ch, self)
+    finally:
+      # Write everything the chapters decoded to the project cache at once
+      self.close()
+    return results
+
+def getSession(fp):
+  """
+    Returns fp if it is already a session, otherwise opens a new session
+    on the path fp
+  """
+  if isinstance(fp, basestring):
+    return GradingSession(fp)
+  return fp
+
+def sessionTest(test):
+  """
+    Decorator for a chapter's test(fp): a path is opened as a GradingSession
+    for the test and closed after it, saving what the test decoded to the
+    project cache. A session is passed through and left open.
+  """
+  @functools.wraps(test)
+  def wrapper(fp):
+    if not isinstance(fp, basestring):
+      return test(fp)
+    with GradingSession(fp) as session:
+      return test(session)
+  return wrapper
+
+def runChapter(ch, session):
+  """
+    Runs chapter ch's test on the given session
+    Returns True, the TestError describing the failures or the exception
+    raised by a chapter which crashed (including failing to import)
+  """
+  name = "ch" + str(ch)
+  if pkgutil.find_loader(name) is None:
+    return TestError([TestCode(ch, 0, description = "no tests for chapter " + str(ch))])
+  try:
+    module = importlib.import_module(name)
+    return module.test(session)
+  except TestError as error:
+    return error
+  except Exception as error:
+    return error
+
+def main():
+  """
+    Grades the project given as first argument against the assignment number
+    given as second argument
+  """
+  session = GradingSession(sys.argv[1])
+  for ch, result in sorted(session.grade(int(sys.argv[2])).items()):
+    print("Chapter {}: {}".format(ch, result))
+
+if __name__ == "__main__":
+  main()
@@ -9,69 +9,75 @@ Functions to find which regions are the same
 '''
 
 def editDistDP(list1, list2, m, n):
-    # Create a table to store results of subproblems
-    dp = [[0 for x in range(n+1)] for x in range(m+1)]
- 
-    # Fill d[][] in bottom up manner
-    for i in range(m+1):
-        for j in range(n+1):
- 
-            # If first string is empty, only option is to
-            # isnert all characters of second string
-            if i == 0:
-                dp[i][j] = j    # Min. operations = j
- 
-            # If second string is empty, only option is to
-            # remove all characters of second string
-            elif j == 0:
-                dp[i][j] = i    # Min. operations = i
- 
-            # If last characters are same, ignore last char
-            # and recur for remaining string
-            elif list1[i-1] == list2[j-1]:
-                dp[i][j] = dp[i-1][j-1]
- 
-            # If last character are different, consider all
-            # possibilities and find minimum
-            else:
-                dp[i][j] = 1 + min(dp[i][j-1],        # Insert
-                                   dp[i-1][j],        # Remove
-                                   dp[i-1][j-1])    # Replace
- 
-    return dp[m][n]
+    # Edit distance between the first m items of list1 and the first n of list2
+    return editDistBits(list1[:m], list2[:n])
+
+
+# Myers/Hyyro bit-parallel edit distance: the DP column for every prefix of
+# seq1 is kept as two bit vectors of +1/-1 vertical deltas, so each item of
+# seq2 costs a handful of integer operations and memory stays O(len(seq1)).
+# With a limit the scan stops as soon as the distance must exceed it and
+# limit + 1 is returned instead.
+def editDistBits(seq1, seq2, limit = None):
+
+    m = len(seq1)
+    n = len(seq2)
+    if limit is not None and abs(m - n) > limit:
+        return limit + 1
+    if m == 0:
+        return n
+
+    # peq[c] has bit i set where seq1[i] == c
+    peq = {}
+    for i, c in enumerate(seq1):
+        peq[c] = peq.get(c, 0) | (1 << i)
+
+    mask = (1 << m) - 1
+    last = 1 << (m - 1)
+    pv = mask
+    mv = 0
+    score = m
+
+    for j, c in enumerate(seq2):
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        # Every remaining item lowers the distance by at most one
+        if limit is not None and score - (n - j - 1) > limit:
+            return limit + 1
+        ph = (ph << 1) | 1
+        mh = mh << 1
+        pv = (mh | ~(xv | ph)) & mask
+        mv = ph & xv & mask
+
+    return score
 
 def get_note_seq(region):
 
-	seq = []
-
-	for note in region:
-
-		seq.append(note["pitch"])
-
-	return seq
+	return region.pitch.tolist()
 
 def get_duration_seq(region):
 
     quantized = quantize_rhythm(region)
 
-    seq = []
-
-    for note in quantized:
-        seq.append(note["duration"])
-
-    return seq
+    return quantized.duration.tolist()
 
 
+# returns a copy of the region with times and durations counted in quanta
 def quantize_rhythm(region, quantum = 120):
 
-	seq = region
-
-	for note in seq:
+	seq = region[:]
 
-		note["duration"] = note["duration"] / quantum
-		note["time"] = note["time"] / quantum
+	seq.duration = region.duration // quantum
+	seq.time = region.time // quantum
 
-	return region
+	return seq
 
 
 def are_equal(region1, region2, min_distance_notes = 2, min_distance_dur = 5):
@@ -79,12 +85,12 @@ def are_equal(region1, region2, min_distance_notes = 2, min_distance_dur = 5):
     note_seq1 = get_note_seq(region1)
     note_seq2 = get_note_seq(region2)
 
-    if editDistDP(note_seq1, note_seq2, len(note_seq1), len(note_seq2)) < min_distance_notes:
+    if editDistBits(note_seq1, note_seq2, min_distance_notes - 1) < min_distance_notes:
 
         dur_seq1 = get_duration_seq(region1)
         dur_seq2 = get_duration_seq(region2)
 
-        if editDistDP(dur_seq1, dur_seq2, len(dur_seq1), len(dur_seq2)) < min_distance_dur:
+        if editDistBits(dur_seq1, dur_seq2, min_distance_dur - 1) < min_distance_dur:
 
             return True
 
@@ -94,28 +100,15 @@ def are_equal(region1, region2, min_distance_notes = 2, min_distance_dur = 5):
 # returns the region from a beginning measure to an end measure. Returns -1 if such a region does not exist
 def grab_section(note_seq, measure_beg, measure_dur, tpqn = 480):
 
-    index_beg = -1
-    index_end = -1
-
     tick_beg = tpqn*4*(measure_beg - 1)
     tick_end = tpqn*4*(measure_beg - 1 + measure_dur)
 
-    for i in range(len(note_seq)):
-        note = note_seq[i]
-        if note['time'] >= tick_beg:
-            index_beg = i
-            break
-    for i in range(len(note_seq)):
-        note = note_seq[i]
-        if note['time'] >= tick_end:
-            index_end = i
-            break
-
-    if index_beg == -1 or index_end == -1:
+    # Both bounds are binary searches on the track's time index
+    if note_seq.countBetween(tick_end) == 0:
         return -1
 
     else:
-        return note_seq[index_beg:index_end]
+        return note_seq.between(tick_beg, tick_end)
 
 
 